@@ -0,0 +1,219 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from compact import EncodedMatrix
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# índice IVF (inverted file) sobre vetores normalizados: k-means esférico define
+# nlist listas e a busca só percorre as nprobe listas mais próximas da consulta.
+# As listas guardam apenas os números das linhas (ids, concatenados por lista com
+# offsets); os vetores são lidos da matriz de referência, já codificada e
+# compartilhada. nprobe maior = mais recall e mais latência
+class IVFIndex:
+    def __init__(self, nlist=256, nprobe=8, iterations=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.trained_size = 0
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    @property
+    def nbytes(self):
+        centroids = self.centroids.nbytes if self.centroids is not None else 0
+        return centroids + self.ids.nbytes + self.offsets.nbytes
+
+    # linhas usadas no treino (a mesma amostra que train faria)
+    def sample_rows(self, n, sample_size=50000):
+        if n <= sample_size:
+            return np.arange(n)
+        rng = np.random.default_rng(self.seed)
+        return np.sort(rng.choice(n, sample_size, replace=False))
+
+    # k-means esférico numa amostra dos vetores
+    def train(self, vectors, sample_size=50000):
+        vectors = _normalize(vectors)
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > sample_size:
+            vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        nlist = max(1, min(self.nlist, len(vectors)))
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = vectors[assignment == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = _normalize(centroids)
+        self.centroids = centroids
+        self.trained_size = len(vectors)
+        self.reset()
+
+    # índice vazio com os mesmos centróides (para reconstruir sem treinar de novo)
+    def empty_copy(self):
+        index = IVFIndex(self.nlist, self.nprobe, self.iterations, self.seed)
+        index.centroids = self.centroids
+        index.trained_size = self.trained_size
+        index.reset()
+        return index
+
+    def reset(self):
+        n = len(self.centroids) if self.centroids is not None else 0
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(n + 1, dtype=np.int64)
+
+    # inserção incremental: cada vetor vai para a lista do centróide mais próximo
+    # (só o id fica no índice; o vetor normalizado é descartado)
+    def add(self, vectors, ids=None):
+        vectors = _normalize(vectors)
+        if ids is None:
+            ids = np.arange(len(self), len(self) + len(vectors))
+        ids = np.asarray(ids, dtype=np.int64)
+        assignment = np.argmax(vectors @ self.centroids.T, axis=1)
+        lists = np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+        lists = np.concatenate([lists, assignment])
+        order = np.argsort(lists, kind="stable")
+        self.ids = np.concatenate([self.ids, ids])[order]
+        counts = np.bincount(lists, minlength=len(self.centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def list_ids(self, c):
+        return self.ids[self.offsets[c]:self.offsets[c + 1]]
+
+    # (ids, similaridades) dos k vizinhos aproximados, em ordem decrescente;
+    # matrix é a matriz de referência (EncodedMatrix) em que os ids são linhas
+    def search(self, query, k, matrix, nprobe=None):
+        query = _normalize(query)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        # ids em ordem crescente: a leitura da matriz mapeada fica sequencial
+        ids = np.sort(np.concatenate([self.list_ids(c) for c in probes]))
+        if not len(ids):
+            return ids, np.zeros(0, dtype=np.float32)
+        scores = matrix.take(ids) @ query
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return ids[top], scores[top]
+
+    @property
+    def params(self):
+        return np.array([self.nlist, self.nprobe, self.iterations, self.seed,
+                         self.trained_size], dtype=np.int64)
+
+    # índice a partir dos arrays salvos (que podem estar mapeados de um arquivo)
+    @classmethod
+    def from_arrays(cls, params, centroids, offsets, ids):
+        nlist, nprobe, iterations, seed, trained_size = (int(v) for v in params)
+        index = cls(nlist, nprobe, iterations, seed)
+        index.centroids = centroids
+        index.trained_size = trained_size
+        index.offsets = offsets
+        index.ids = ids
+        return index
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, params=self.params, centroids=self.centroids,
+                 offsets=self.offsets, ids=self.ids)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        if "offsets" not in data:
+            # formato antigo (listas com cópia dos vetores): só os centróides servem
+            index = cls.from_arrays(data["params"], data["centroids"], None, None)
+            index.reset()
+            return index
+        return cls.from_arrays(data["params"], data["centroids"], data["offsets"], data["ids"])
+
+
+# recall@k do IVF contra a busca exata (força bruta) para vários nprobe,
+# com a latência média de cada um
+def recall_report(index, vectors, queries, k=5, nprobes=(1, 2, 4, 8, 16, 32)):
+    vectors = _normalize(vectors)
+    queries = _normalize(queries)
+    matrix = EncodedMatrix(vectors)
+    k = min(k, len(vectors))
+
+    start = time.perf_counter()
+    exact = []
+    for query in queries:
+        scores = vectors @ query
+        exact.append(set(np.argpartition(-scores, k - 1)[:k].tolist()))
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    rows = []
+    for nprobe in nprobes:
+        if nprobe > len(index.centroids):
+            break
+        start = time.perf_counter()
+        hits = 0
+        for query, truth in zip(queries, exact):
+            ids, _ = index.search(query, k, matrix, nprobe)
+            hits += len(truth.intersection(ids.tolist()))
+        rows.append({
+            "nprobe": nprobe,
+            "recall": hits / (k * len(queries)),
+            "latency_ms": (time.perf_counter() - start) * 1000 / len(queries),
+        })
+    return {"references": len(vectors), "queries": len(queries), "k": k,
+            "nlist": len(index.centroids), "exact_latency_ms": exact_ms, "ivf": rows}
+
+
+# python ann.py index_cache/<índice>.npz --nlist 256 --k 5
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Recall do índice IVF em relação à busca exata, usando um índice de referência salvo")
+    parser.add_argument("index_file", help="arquivo .npz salvo pelo ReferenceIndex")
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.05,
+                        help="ruído relativo aplicado às referências usadas como consulta")
+    args = parser.parse_args(argv)
+
+    vectors = np.load(args.index_file)["features"].astype(np.float32)
+    if len(vectors) < 2:
+        print("O índice precisa de pelo menos duas referências")
+        return 1
+    vectors = _normalize(vectors.reshape(len(vectors), -1))
+
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    queries = vectors[picks] + args.noise * rng.standard_normal(
+        (len(picks), vectors.shape[1])).astype(np.float32) / np.sqrt(vectors.shape[1])
+
+    index = IVFIndex(nlist=args.nlist)
+    index.train(vectors)
+    index.add(vectors)
+    report = recall_report(index, vectors, queries, args.k)
+    print(f"referências: {report['references']}  consultas: {report['queries']}  "
+          f"k: {report['k']}  nlist: {report['nlist']}")
+    print(f"exato: {report['exact_latency_ms']:.3f} ms/consulta")
+    for row in report["ivf"]:
+        print(f"nprobe={row['nprobe']:<4} recall={row['recall']:.3f}  "
+              f"{row['latency_ms']:.3f} ms/consulta")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
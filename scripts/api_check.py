@@ -1,23 +1,41 @@
 import os
+import asyncio
 import numpy as np
-from PIL import Image
-import cv2
-from skimage.metrics import structural_similarity as ssim
-import matplotlib.pyplot as plt
 import io
-import base64
-from fastapi import FastAPI, File, UploadFile, Form
+import json
+import tarfile
+import zipfile
+import traceback
+import weakref
+from contextlib import contextmanager
+from fastapi import FastAPI, File, UploadFile, Form, Request, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
+from starlette.background import BackgroundTask
+from typing import List, Optional
 import uvicorn
-from tensorflow.keras.applications import VGG16
-from tensorflow.keras.applications.vgg16 import preprocess_input
-from tensorflow.keras.models import Model
-import tensorflow as tf
 from pydantic import BaseModel
-import shutil
+import time
+import threading
+from reference_index import ReferenceIndex, IMAGE_EXTENSIONS
+from reference_collections import load_collections, parse_selection, UnknownCollection
+from compact import CompactEncoder, global_pool
+from embedding import (build_vgg16, load_backend, parity_check, load_sample,
+                       preprocess_image, KerasBackend)
+from matching import best_match, SEMANTIC_WEIGHT, VISUAL_WEIGHT
+from batcher import MicroBatcher
+from workers import BoundedExecutor, PoolSaturated
+from imaging import decode_upload, gray_thumbnail, ImageTooLarge, InvalidImage
+from ssim_batch import UploadStats, ssim_batch
+from result_cache import ResultCache, content_key
+from phash import dhash, SeenUploads
+from watcher import ReferenceWatcher
+from charts import create_confidence_chart, CHART_FORMATS, cache_stats as chart_cache_stats
+from metrics import Metrics, server_timing
+from jobs import JobQueue, QueueFull
+from modes import MODES, ModeSelector
 
-# remover mensagens de aviso do TensorFlow
+# remover mensagens de aviso do TensorFlow (importado só ao carregar o modelo)
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 
@@ -36,184 +54,1007 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Configuração
+DEFAULT_REFERENCE_DIR = os.environ.get(
+    "NOTIFICHECK_REFERENCE_DIR", r"C:\proj_notific_fake\data\real")
+# coleções nomeadas: arquivo JSON nome -> diretório; sem ele, só a coleção "default"
+COLLECTIONS_FILE = os.environ.get("NOTIFICHECK_COLLECTIONS") or None
+INDEX_CACHE_DIR = os.environ.get("NOTIFICHECK_INDEX_DIR", "index_cache")
+# intervalo mínimo (segundos) entre verificações do diretório de referência
+INDEX_REFRESH_INTERVAL = float(os.environ.get("NOTIFICHECK_INDEX_REFRESH", "30"))
+# observar os diretórios de referência (watchdog) em vez de verificar a cada requisição
+WATCH_REFERENCES = os.environ.get("NOTIFICHECK_WATCH", "1") == "1"
+WATCH_DEBOUNCE = float(os.environ.get("NOTIFICHECK_WATCH_DEBOUNCE", "2"))
+# snapshot mapeado em memória e compartilhado entre os workers do uvicorn
+SHARED_SNAPSHOT = os.environ.get("NOTIFICHECK_SHARED_SNAPSHOT", "0") == "1"
+# resolução canônica (largura x altura) em que o SSIM é calculado
+SSIM_SIZE = tuple(int(v) for v in os.environ.get("NOTIFICHECK_SSIM_SIZE", "216x480").split("x"))
+# SSIM: batch (vetorizado, vários candidatos por chamada) ou skimage (um por vez)
+SSIM_ENGINE = os.environ.get("NOTIFICHECK_SSIM_ENGINE", "batch")
+# candidatos calculados por chamada do SSIM vetorizado
+SSIM_BATCH = int(os.environ.get("NOTIFICHECK_SSIM_BATCH", "8"))
+# quantas referências (as mais próximas pelo VGG16) passam pelo SSIM; 0 = todas
+TOP_K = int(os.environ.get("NOTIFICHECK_TOP_K", "5"))
+# pontuação combinada a partir da qual a busca para imediatamente
+CERTAIN_MATCH = float(os.environ.get("NOTIFICHECK_CERTAIN_MATCH", "0.95"))
+# micro-batching do VGG16: até BATCH_SIZE imagens ou BATCH_WAIT_MS por forward pass
+BATCH_SIZE = int(os.environ.get("NOTIFICHECK_BATCH_SIZE", "16"))
+BATCH_WAIT_MS = float(os.environ.get("NOTIFICHECK_BATCH_WAIT_MS", "5"))
+# pool para etapas de CPU; 0 = calcular a partir do número de núcleos
+CPU_WORKERS = int(os.environ.get("NOTIFICHECK_CPU_WORKERS", "0"))
+# requisições em andamento aceitas antes de responder 503
+MAX_PENDING = int(os.environ.get("NOTIFICHECK_MAX_PENDING", "0"))
+RETRY_AFTER = int(os.environ.get("NOTIFICHECK_RETRY_AFTER", "2"))
+# máximo de imagens por chamada a /analyze/batch
+MAX_BATCH_FILES = int(os.environ.get("NOTIFICHECK_MAX_BATCH_FILES", "500"))
+# limites de upload: bytes por imagem, bytes por arquivo zip/tar e pixels por imagem
+MAX_UPLOAD_BYTES = int(os.environ.get("NOTIFICHECK_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_ARCHIVE_BYTES = int(os.environ.get("NOTIFICHECK_MAX_ARCHIVE_BYTES", str(200 * 1024 * 1024)))
+# bytes descompactados de um zip/tar (o limite acima vale só para o arquivo compactado)
+MAX_EXTRACTED_BYTES = int(os.environ.get("NOTIFICHECK_MAX_EXTRACTED_BYTES",
+                                         str(2 * MAX_ARCHIVE_BYTES)))
+MAX_UPLOAD_PIXELS = int(os.environ.get("NOTIFICHECK_MAX_UPLOAD_PIXELS", "25000000"))
+# maior lado com que a imagem enviada é decodificada; 0 = resolução original
+DECODE_MAX_SIDE = int(os.environ.get("NOTIFICHECK_DECODE_MAX_SIDE", "1024"))
+# cache de resultados: entradas em memória, validade (s) e diretório opcional em disco
+RESULT_CACHE_SIZE = int(os.environ.get("NOTIFICHECK_RESULT_CACHE_SIZE", "10000"))
+RESULT_CACHE_TTL = float(os.environ.get("NOTIFICHECK_RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_DIR = os.environ.get("NOTIFICHECK_RESULT_CACHE_DIR") or None
+# arquivos mantidos no cache em disco (os mais antigos são removidos); 0 = sem limite
+RESULT_CACHE_DISK_ENTRIES = int(os.environ.get("NOTIFICHECK_RESULT_CACHE_DISK_ENTRIES", "100000"))
+# distância de Hamming (dHash de 64 bits) para tratar uma referência como candidata
+# a cópia da imagem; o candidato só vale depois de confirmado pelo cosseno e SSIM. 0 desliga
+PHASH_MAX_DISTANCE = int(os.environ.get("NOTIFICHECK_PHASH_MAX_DISTANCE", "4"))
+# uploads anteriores reaproveitados pelo dHash de 256 bits (16x16), sem nova análise;
+# 0 desliga (padrão)
+PHASH_SEEN_SIZE = int(os.environ.get("NOTIFICHECK_PHASH_SEEN_SIZE", "0"))
+PHASH_SEEN_DISTANCE = int(os.environ.get("NOTIFICHECK_PHASH_SEEN_DISTANCE", "2"))
+PHASH_SEEN_HASH_SIZE = 16
+# arquivo local com os pesos do VGG16 sem o topo; sem ele, pesos do ImageNet pelo Keras
+VGG16_WEIGHTS = os.environ.get("NOTIFICHECK_VGG16_WEIGHTS") or None
+# backend de inferência: keras, compiled (tf.function/XLA) ou tflite
+EMBEDDING_BACKEND = os.environ.get("NOTIFICHECK_BACKEND", "keras")
+TFLITE_QUANTIZATION = os.environ.get("NOTIFICHECK_TFLITE_QUANTIZATION", "dynamic")
+TFLITE_PATH = os.environ.get(
+    "NOTIFICHECK_TFLITE_PATH", os.path.join(INDEX_CACHE_DIR, f"vgg16-{TFLITE_QUANTIZATION}.tflite"))
+# comparar o backend escolhido com o Keras ao iniciar
+PARITY_CHECK = os.environ.get("NOTIFICHECK_PARITY_CHECK", "0") == "1"
+# modo do vetor: full (7x7x512 completo) ou compact (pooling + PCA + float16/int8)
+EMBEDDING_MODE = os.environ.get("NOTIFICHECK_EMBEDDING_MODE", "full")
+COMPACT_COMPONENTS = int(os.environ.get("NOTIFICHECK_COMPACT_COMPONENTS", "128"))
+COMPACT_DTYPE = os.environ.get("NOTIFICHECK_COMPACT_DTYPE", "float16")
+# índice aproximado (IVF) para conjuntos de referência muito grandes
+ANN_ENABLED = os.environ.get("NOTIFICHECK_ANN", "0") == "1"
+ANN_NLIST = int(os.environ.get("NOTIFICHECK_ANN_NLIST", "256"))
+ANN_NPROBE = int(os.environ.get("NOTIFICHECK_ANN_NPROBE", "8"))
+ANN_MIN_REFERENCES = int(os.environ.get("NOTIFICHECK_ANN_MIN_REFERENCES", "5000"))
+# análises assíncronas (/jobs): tamanho da fila, workers e validade (s) dos resultados
+JOB_QUEUE_SIZE = int(os.environ.get("NOTIFICHECK_JOB_QUEUE", "100"))
+JOB_WORKERS = int(os.environ.get("NOTIFICHECK_JOB_WORKERS", "4"))
+JOB_TTL = float(os.environ.get("NOTIFICHECK_JOB_TTL", "600"))
+
+# modo padrão das análises: fast, balanced ou thorough
+DEFAULT_MODE = os.environ.get("NOTIFICHECK_MODE", "balanced")
+# rebaixar o modo com mais que DEGRADE_QUEUE análises em andamento ou na fila
+# (0 = metade de NOTIFICHECK_MAX_PENDING) ou com a duração média das análises acima
+# de DEGRADE_LATENCY_MS (0 desliga); DEGRADE_HOLD = espera (s) antes de voltar ao normal
+DEGRADE_QUEUE = int(os.environ.get("NOTIFICHECK_DEGRADE_QUEUE", "0"))
+DEGRADE_LATENCY_MS = float(os.environ.get("NOTIFICHECK_DEGRADE_LATENCY_MS", "0"))
+DEGRADE_HOLD = float(os.environ.get("NOTIFICHECK_DEGRADE_HOLD", "10"))
+
+# Limiar para classificação
+THRESHOLD = 0.65
+
 # Carregar o modelo VGG16
-model = None
+backend = None
+batcher = None
+parity_report = None
+watcher = None
+cpu_pool = BoundedExecutor(CPU_WORKERS or None, MAX_PENDING or None)
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_CACHE_DIR,
+                           RESULT_CACHE_DISK_ENTRIES)
+seen_uploads = SeenUploads(PHASH_SEEN_SIZE)
+# rejected: candidatos do dHash que o cosseno e o SSIM não confirmaram (também contam como misses)
+phash_stats = {"reference_hits": 0, "upload_hits": 0, "misses": 0, "rejected": 0}
+metrics = Metrics()
+jobs = JobQueue(JOB_QUEUE_SIZE, JOB_WORKERS, JOB_TTL)
+if DEFAULT_MODE not in MODES:
+    raise ValueError(f"NOTIFICHECK_MODE deve ser um de {', '.join(MODES)}")
+mode_selector = ModeSelector(DEGRADE_QUEUE or cpu_pool.max_pending // 2,
+                             DEGRADE_LATENCY_MS / 1000, DEGRADE_HOLD)
+
+configured_collections = load_collections(COLLECTIONS_FILE, DEFAULT_REFERENCE_DIR)
+# coleções usadas quando a requisição não escolhe nenhuma (padrão: todas)
+DEFAULT_SELECTION = parse_selection(
+    os.environ.get("NOTIFICHECK_DEFAULT_COLLECTIONS"), configured_collections)
+
+# inicialização em segundo plano: fase atual, duração (s) de cada fase e erro
+startup_state = {"ready": False, "phase": None, "phases": {}, "error": None}
+startup_task = None
+
+# índices de referência já carregados, por coleção
+reference_indexes = {}
+reference_indexes_lock = threading.Lock()
+
+
+# lote de tensores -> vetores no modo configurado (completo ou com pooling)
+
+
+def batch_predictor(backend):
+    if EMBEDDING_MODE == "compact":
+        return lambda batch: global_pool(backend.embed_batch(batch))
+    return backend.embed_batch
+
+
+# índice de referência com os parâmetros da API (também usado pelo scan_check.py)
+
+
+def new_reference_index(reference_dir, embed_fn, shared=SHARED_SNAPSHOT):
+    encoder = (CompactEncoder(COMPACT_COMPONENTS, COMPACT_DTYPE)
+               if EMBEDDING_MODE == "compact" else None)
+    return ReferenceIndex(
+        reference_dir, embed_fn, INDEX_CACHE_DIR, encoder=encoder, cache_tag=EMBEDDING_MODE,
+        ann_params=({"nlist": ANN_NLIST, "nprobe": ANN_NPROBE,
+                     "min_size": ANN_MIN_REFERENCES} if ANN_ENABLED else None),
+        thumbnail_size=SSIM_SIZE, shared=shared)
+
+
+class NotReady(Exception):
+    pass
+
+
+def check_ready():
+    if not startup_state["ready"]:
+        raise NotReady()
+
+
+# cronometrar uma fase da inicialização
+@contextmanager
+def startup_phase(name):
+    startup_state["phase"] = name
+    print(f"Inicialização: {name}...")
+    start = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - start
+    startup_state["phases"][name] = seconds
+    print(f"Inicialização: {name} em {seconds:.2f}s")
+
+
+# um forward pass em cada tamanho de lote que o backend compila (o primeiro
+# request não paga o tracing do grafo), o SSIM e o gráfico SVG padrão (o PNG é
+# opcional e continua importando o matplotlib só quando for pedido)
+def warmup(backend):
+    image = np.zeros((SSIM_SIZE[1], SSIM_SIZE[0], 3), dtype=np.uint8)
+    tensor = preprocess_image(image)
+    sizes = {1, BATCH_SIZE}
+    if backend.name == "compiled":
+        size = 1
+        while size < BATCH_SIZE:
+            sizes.add(size)
+            size *= 2
+    predict = batch_predictor(backend)
+    for size in sorted(sizes):
+        predict(np.stack([tensor] * size))
+    gray = gray_thumbnail(image, SSIM_SIZE)
+    ssim_batch(UploadStats(gray), gray)
+    create_confidence_chart(0.0, THRESHOLD)
+
+
+# modelo, aquecimento e índices; até terminar, /ready responde 503 e as análises
+# são recusadas com 503, mas o servidor já aceita conexões (/health)
+async def prepare():
+    global backend, batcher, parity_report
+    start = time.perf_counter()
+    try:
+        with startup_phase("modelo"):
+            model = await cpu_pool.run(build_vgg16, VGG16_WEIGHTS)
+
+        # imagens de referência servem de amostra para a quantização int8 e a verificação
+        sample = None
+        sample_dir = next((c["dir"] for c in configured_collections.values()
+                           if os.path.isdir(c["dir"])), None)
+        if sample_dir and (
+                PARITY_CHECK or (EMBEDDING_BACKEND == "tflite" and TFLITE_QUANTIZATION == "int8")):
+            with startup_phase("amostra"):
+                sample = await cpu_pool.run(load_sample, [
+                    os.path.join(sample_dir, f) for f in sorted(os.listdir(sample_dir))
+                    if f.lower().endswith(IMAGE_EXTENSIONS)])
+
+        with startup_phase("backend"):
+            backend = await cpu_pool.run(
+                load_backend, EMBEDDING_BACKEND, model, max_batch=BATCH_SIZE,
+                quantization=TFLITE_QUANTIZATION, tflite_path=TFLITE_PATH, representative=sample)
+        with startup_phase("aquecimento"):
+            await cpu_pool.run(warmup, backend)
+        batcher = MicroBatcher(
+            batch_predictor(backend), max_batch=BATCH_SIZE, max_wait_ms=BATCH_WAIT_MS,
+            on_batch=lambda size, seconds: metrics.observe("vgg16_batch", seconds))
+        print(f"Modelo carregado com sucesso! (backend: {backend.name})")
+
+        if PARITY_CHECK and sample is not None and len(sample) and backend.name != "keras":
+            with startup_phase("paridade"):
+                parity_report = await cpu_pool.run(parity_check, backend, KerasBackend(model), sample)
+            print(f"Desvio em relação ao Keras: {parity_report}")
+
+        # todas as coleções são indexadas antes da primeira requisição
+        with startup_phase("índices"):
+            for name, collection in configured_collections.items():
+                if not os.path.isdir(collection["dir"]):
+                    print(f"Coleção {name}: diretório {collection['dir']} não encontrado")
+                    continue
+                index = await cpu_pool.run(get_reference_index, name)
+                print(f"Coleção {name} carregada: {len(index.snapshot)} imagens")
+    except Exception as e:
+        startup_state["error"] = f"{startup_state['phase']}: {e}"
+        print(f"Falha na inicialização ({startup_state['phase']})")
+        traceback.print_exc()
+        return
+    startup_state["phase"] = None
+    startup_state["ready"] = True
+    print(f"Pronto para receber requisições ({time.perf_counter() - start:.1f}s)")
 
 
 @app.on_event("startup")
 async def startup_event():
-    global model
-    print("Carregando modelo VGG16...")
-    base_model = VGG16(weights='imagenet', include_top=False)
-    model = Model(inputs=base_model.input, outputs=base_model.output)
-    print("Modelo carregado com sucesso!")
+    global watcher, startup_task
+    if WATCH_REFERENCES:
+        watcher = ReferenceWatcher(WATCH_DEBOUNCE)
+    jobs.start()
+    startup_task = asyncio.create_task(prepare())
 
-# extrair características de uma imagem  
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+    await jobs.stop()
+    if watcher is not None:
+        watcher.stop()
+    cpu_pool.shutdown()
 
-def extract_features(img, model):
-    img = cv2.resize(img, (224, 224))
-    img = np.expand_dims(img, axis=0)
-    img = preprocess_input(img)
-    features = model.predict(img, verbose=0)  # Desativar saída verbosa
-    return features.flatten()
+# obter o índice de uma coleção; sem o watcher, sincroniza no máximo a cada INDEX_REFRESH_INTERVAL.
+# No modo compartilhado a verificação periódica continua mesmo com o watcher, para que
+# os workers que não montaram o snapshot passem a mapear a versão nova
 
-# calcular a similaridade entre duas imagens
 
+def get_reference_index(name, force_refresh=False):
+    with reference_indexes_lock:
+        index = reference_indexes.get(name)
+        if index is None:
+            index = new_reference_index(
+                configured_collections[name]["dir"],
+                lambda img: batcher.submit(preprocess_image(img)).result())
+            index.collection = name
+            index.last_check = 0.0
+            reference_indexes[name] = index
+            if watcher is not None:
+                watcher.watch(index)
 
-def compare_images_ssim(img1, img2):
-    # Converter para escala de cinza
-    img1_gray = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-    img2_gray = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
+    now = time.monotonic()
+    if (force_refresh or not index.snapshot.version
+            or ((not index.watched or index.shared)
+                and now - index.last_check >= INDEX_REFRESH_INTERVAL)):
+        index.refresh()
+        index.last_check = now
+    return index
 
-    # Redimensionar imagens para o mesmo tamanho
-    img2_gray = cv2.resize(img2_gray, (img1_gray.shape[1], img1_gray.shape[0]))
+# snapshots atuais das coleções escolhidas, na ordem pedida (nome -> snapshot);
+# coleções cujo diretório não existe ficam de fora
 
-    # Calcular SSIM
-    (score, diff) = ssim(img1_gray, img2_gray, full=True)
-    return score
 
-# calcular a similaridade entre características extraídas pelo VGG16
+def get_selection(names):
+    return {name: get_reference_index(name).snapshot for name in names
+            if os.path.isdir(configured_collections[name]["dir"])}
 
 
-def compare_features(features1, features2):
-    return np.dot(features1, features2) / (np.linalg.norm(features1) * np.linalg.norm(features2))
+def selection_version(selection):
+    return "|".join(f"{name}:{snapshot.version}" for name, snapshot in selection.items())
 
-# Criar um gráfico
 
+def selection_size(selection):
+    return sum(len(snapshot) for snapshot in selection.values())
 
-def create_confidence_chart(confidence, threshold):
-    fig, ax = plt.subplots(figsize=(5, 0.7))
-    ax.barh(["Confiança"], [confidence],
-            color='blue' if confidence/100 > threshold else 'red')
-    ax.axvline(x=threshold*100, color='green', linestyle='--', alpha=0.7)
-    ax.set_xlim(0, 100)
-    ax.set_xlabel('Porcentagem (%)')
-    ax.grid(True, alpha=0.3)
+# calcular a similaridade entre duas imagens
+
+
+def compare_images_ssim(img1, img2):
+    # Converter para escala de cinza na resolução canônica do SSIM
+    img1_gray = gray_thumbnail(img1, SSIM_SIZE)
+    img2_gray = gray_thumbnail(img2, SSIM_SIZE)
 
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png')
-    plt.close(fig)
-    buf.seek(0)
+    # Calcular SSIM (sem o mapa de diferenças)
+    if SSIM_ENGINE == "skimage":
+        from skimage.metrics import structural_similarity as ssim
+        return ssim(img1_gray, img2_gray)
+    return float(ssim_batch(UploadStats(img1_gray), img2_gray)[0])
 
-    return base64.b64encode(buf.getvalue()).decode()
+# calcular a similaridade entre características extraídas pelo VGG16
 
 
+def compare_features(features1, features2):
+    return np.dot(features1, features2) / (np.linalg.norm(features1) * np.linalg.norm(features2))
+
 class AnalysisResult(BaseModel):
     is_authentic: bool
     confidence: float
-    confidence_chart: str
+    confidence_chart: Optional[str] = None
     combined_score: float
-    visual_similarity: float
+    # sem SSIM no modo fast
+    visual_similarity: Optional[float] = None
     semantic_similarity: float
     best_match_file: Optional[str] = None
+    collection: Optional[str] = None
+    # modo usado e se ele foi rebaixado por causa da carga
+    mode: Optional[str] = None
+    degraded: bool = False
+
+
+class BatchAnalysisResult(AnalysisResult):
+    filename: str
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[AnalysisResult] = None
+    error: Optional[str] = None
+
+
+# Ler o upload em memória, recusando assim que passar do limite de bytes
+
+
+async def read_upload(file, max_bytes=None):
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    data = await file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise HTTPException(
+            status_code=413, detail=f"{file.filename} excede o limite de {max_bytes} bytes")
+    return data
+
+
+def decode_image(data):
+    return decode_upload(data, max_pixels=MAX_UPLOAD_PIXELS, max_side=DECODE_MAX_SIDE)
+
+def check_member_size(name, size):
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413, detail=f"{name} excede o limite de {MAX_UPLOAD_BYTES} bytes")
+
+# Extrair as imagens de um arquivo zip ou tar. Para antes de descompactar tudo:
+# no máximo max_items imagens e MAX_EXTRACTED_BYTES bytes descompactados
+
+
+def too_many_files():
+    return HTTPException(status_code=413, detail=f"Máximo de {MAX_BATCH_FILES} imagens por lote")
+
+
+def check_extracted(filename, total):
+    if total > MAX_EXTRACTED_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{filename} excede o limite de {MAX_EXTRACTED_BYTES} bytes descompactados")
+
+
+def read_archive(filename, data, max_items=MAX_BATCH_FILES):
+    items = []
+    total = 0
+    buffer = io.BytesIO(data)
+    try:
+        if zipfile.is_zipfile(buffer):
+            with zipfile.ZipFile(buffer) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                        if len(items) >= max_items:
+                            raise too_many_files()
+                        # o zipfile não lê além do tamanho declarado
+                        check_member_size(info.filename, info.file_size)
+                        total += info.file_size
+                        check_extracted(filename, total)
+                        items.append((info.filename, archive.read(info)))
+        else:
+            buffer.seek(0)
+            with tarfile.open(fileobj=buffer, mode="r:*") as archive:
+                # iteração preguiçosa: o getmembers() descompactaria o arquivo inteiro.
+                # Todo membro conta no limite, porque pular um membro também o descompacta
+                for member in archive:
+                    total += member.size
+                    check_extracted(filename, total)
+                    if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                        if len(items) >= max_items:
+                            raise too_many_files()
+                        check_member_size(member.name, member.size)
+                        items.append((member.name, archive.extractfile(member).read()))
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError):
+        raise HTTPException(
+            status_code=400, detail=f"{filename} não é um arquivo zip ou tar válido")
+    return items
+
+# Encontrar a melhor referência para a imagem
+
+
+def score_upload(img_array, features_uploaded, selection, mode="balanced", candidate=None):
+    if mode == "fast":
+        return semantic_match(features_uploaded, selection)
+
+    # thorough: SSIM contra todas as referências (busca exata, sem o IVF) e sem
+    # parar na primeira correspondência "certa"
+    top_k = 0 if mode == "thorough" else TOP_K
+    certain_match = float("inf") if mode == "thorough" else CERTAIN_MATCH
+
+    # Calcular similaridade estrutural (SSIM) contra as miniaturas já em memória
+    with metrics.stage("ssim"):
+        upload_gray = gray_thumbnail(img_array, SSIM_SIZE)
+        upload_stats = UploadStats(upload_gray) if SSIM_ENGINE == "batch" else None
+
+    # candidato do dHash: pontuação real (cosseno e SSIM) contra essa única referência;
+    # se já passa de certain_match, a busca e o SSIM dos demais candidatos são pulados
+    if candidate is not None:
+        name, i = candidate
+        match = confirm_candidate(upload_gray, upload_stats, features_uploaded, selection, name, i)
+        if match["combined_score"] >= certain_match:
+            phash_stats["reference_hits"] += 1
+            return match
+        phash_stats["rejected"] += 1
+        phash_stats["misses"] += 1
+
+    # Cosseno contra as referências de cada coleção escolhida; SSIM só nas
+    # TOP_K mais próximas entre todas elas
+    with metrics.stage("search"):
+        refs, candidates = [], []
+        for name, snapshot in selection.items():
+            for i, score in snapshot.search(features_uploaded, top_k):
+                candidates.append((len(refs), score))
+                refs.append((name, i))
+        candidates.sort(key=lambda c: c[1], reverse=True)
+        if top_k > 0:
+            candidates = candidates[:top_k]
+
+    # os candidatos são pedidos em ordem; ao pedir um, o SSIM vetorizado já calcula
+    # os próximos SSIM_BATCH de uma vez (a parada antecipada descarta o resto)
+    ranked = [ref for ref, _ in candidates]
+    position = {ref: p for p, ref in enumerate(ranked)}
+    visual = {}
+
+    def ssim_against(ref):
+        if ref not in visual:
+            with metrics.stage("ssim"):
+                if upload_stats is None:
+                    from skimage.metrics import structural_similarity as ssim
+                    name, i = refs[ref]
+                    visual[ref] = ssim(upload_gray, selection[name].thumbnails[i])
+                else:
+                    chunk = ranked[position[ref]:position[ref] + max(SSIM_BATCH, 1)]
+                    thumbnails = np.stack([selection[refs[r][0]].thumbnails[refs[r][1]]
+                                           for r in chunk])
+                    visual.update(zip(chunk, ssim_batch(upload_stats, thumbnails).tolist()))
+        return visual[ref]
+
+    match = best_match(candidates, ssim_against, certain_match=certain_match)
+    if match["index"] is not None:
+        match["collection"], match["index"] = refs[match["index"]]
+    return match
+
+# Modo fast: só o cosseno do VGG16 (a referência mais próxima de cada coleção);
+# a pontuação combinada é a própria similaridade semântica
+
+
+def semantic_match(features_uploaded, selection):
+    best = {"index": None, "combined_score": 0,
+            "visual_similarity": None, "semantic_similarity": 0}
+    with metrics.stage("search"):
+        for name, snapshot in selection.items():
+            for i, score in snapshot.search(features_uploaded, 1):
+                if score > best["semantic_similarity"]:
+                    best = {"index": i, "collection": name, "combined_score": float(score),
+                            "visual_similarity": None, "semantic_similarity": float(score)}
+    return best
+
+def confirm_candidate(upload_gray, upload_stats, features_uploaded, selection, name, i):
+    snapshot = selection[name]
+    semantic = snapshot.score(features_uploaded, i)
+    with metrics.stage("ssim"):
+        if upload_stats is None:
+            from skimage.metrics import structural_similarity as ssim
+            visual = float(ssim(upload_gray, snapshot.thumbnails[i]))
+        else:
+            visual = float(ssim_batch(upload_stats, snapshot.thumbnails[i])[0])
+    return {"index": i, "collection": name,
+            "combined_score": SEMANTIC_WEIGHT * semantic + VISUAL_WEIGHT * visual,
+            "visual_similarity": visual, "semantic_similarity": semantic}
+
+# Referência mais próxima pelo dHash (cópia recomprimida/redimensionada?): só um
+# candidato para score_upload confirmar, nunca um resultado por si só
+
+
+def hash_candidate(image_hash, selection):
+    found = min(((distance, index, name)
+                 for name, snapshot in selection.items()
+                 for distance, index in snapshot.hash_tree.search(image_hash, PHASH_MAX_DISTANCE)[:1]),
+                default=None)
+    if found is None:
+        return None
+    _, index, name = found
+    return name, index
+
+# Upload já analisado com o mesmo dHash de 256 bits (a cópia de um print já visto)
+
+
+def seen_upload(upload_hash, version):
+    result = seen_uploads.find(upload_hash, version, PHASH_SEEN_DISTANCE)
+    if result is not None:
+        phash_stats["upload_hits"] += 1
+    return result
+
+# Montar a resposta a partir da melhor correspondência
+
+
+def build_result(match, selection):
+    best_match_score = float(match["combined_score"])
+
+    # Calcular confiança em porcentagem
+    confidence = best_match_score * 100
+
+    # Determinar resultado
+    is_authentic = best_match_score > THRESHOLD
+
+    return {
+        "is_authentic": is_authentic,
+        "confidence": confidence,
+        "combined_score": best_match_score,
+        "visual_similarity": (float(match["visual_similarity"])
+                              if match["visual_similarity"] is not None else None),
+        "semantic_similarity": float(match["semantic_similarity"]),
+        "best_match_file": (selection[match["collection"]].names[match["index"]]
+                            if match["index"] is not None else None),
+        "collection": match.get("collection"),
+    }
+
+# Anexar o gráfico de confiança (fora do cache de resultados, que guarda só os números)
+
+
+def with_chart(result, chart_format):
+    if chart_format is None:
+        return result
+    chart = create_confidence_chart(result["confidence"], THRESHOLD, chart_format)
+    return dict(result, confidence_chart=chart)
+
+
+def check_mode(mode):
+    if not mode:
+        return DEFAULT_MODE
+    if mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"mode deve ser um de {', '.join(MODES)}")
+    return mode
+
+
+def check_chart_format(include_chart, chart_format):
+    if not include_chart:
+        return None
+    if chart_format not in CHART_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"chart_format deve ser um de {', '.join(CHART_FORMATS)}")
+    return chart_format
+
+# Pipeline completo de uma imagem já decodificada; as etapas pesadas rodam
+# no pool de CPU e o event loop fica livre para aceitar outras conexões
+
+
+async def run_analysis(img_array, selection, mode=DEFAULT_MODE):
+    # o modo muda o resultado: entra na chave do cache e na versão dos uploads já vistos
+    version = selection_version(selection) + f"|{mode}"
+    # Mesma imagem, mesmas referências e mesmos parâmetros: resultado já conhecido
+    with metrics.stage("cache"):
+        key = await cpu_pool.run(
+            content_key, img_array, version, SSIM_SIZE, SSIM_ENGINE, THRESHOLD, TOP_K,
+            CERTAIN_MATCH, ANN_ENABLED, ANN_NPROBE, EMBEDDING_MODE, COMPACT_COMPONENTS, COMPACT_DTYPE)
+        if result_cache.disk_dir:
+            cached = await cpu_pool.run(result_cache.get, key)
+        else:
+            cached = result_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # thorough é a análise exaustiva: sem os atalhos do dHash (uploads já vistos e
+    # candidato por hash), sempre com o SSIM contra todas as referências
+    exhaustive = mode == "thorough"
+    seen_enabled = PHASH_SEEN_SIZE > 0 and not exhaustive
+    hash_enabled = PHASH_MAX_DISTANCE > 0 and mode == "balanced"
+
+    if seen_enabled:
+        with metrics.stage("phash"):
+            upload_hash = await cpu_pool.run(dhash, img_array, PHASH_SEEN_HASH_SIZE)
+            result = await cpu_pool.run(seen_upload, upload_hash, version)
+        if result is not None:
+            await cpu_pool.run(result_cache.put, key, result)
+            return result
+
+    candidate = None
+    if hash_enabled:
+        with metrics.stage("phash"):
+            image_hash = await cpu_pool.run(dhash, img_array)
+            candidate = await cpu_pool.run(hash_candidate, image_hash, selection)
+    if candidate is None and (seen_enabled or hash_enabled):
+        phash_stats["misses"] += 1
+
+    # Extrair características da imagem carregada
+    # (agrupada com outras requisições simultâneas em um único forward pass)
+    with metrics.stage("vgg16"):
+        tensor = await cpu_pool.run(preprocess_image, img_array)
+        features_uploaded = await asyncio.wrap_future(batcher.submit(tensor))
+
+    match = await cpu_pool.run(score_upload, img_array, features_uploaded, selection, mode,
+                               candidate)
+    result = await cpu_pool.run(build_result, match, selection)
+    with metrics.stage("cache"):
+        await cpu_pool.run(result_cache.put, key, result)
+    if seen_enabled:
+        # ao passar do limite, o add reconstrói a BK-tree: fora do event loop
+        await cpu_pool.run(seen_uploads.add, upload_hash, version, result)
+    return result
+
+
+# Cronometrar cada requisição e devolver as etapas no cabeçalho Server-Timing.
+# Na análise em lote o cabeçalho sai antes das imagens, então só traz o recebimento
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    path = request.url.path
+    route = next((pattern for regex, pattern in known_routes if regex.match(path)), "other")
+    timings, token = metrics.start_request()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        metrics.end_request(token, route, status, time.perf_counter() - start)
+    timings["total"] = time.perf_counter() - start
+    response.headers["Server-Timing"] = server_timing(timings)
+    return response
+
+
+# Decodificar e analisar uma imagem já recebida (com o gráfico, se pedido)
+
+
+async def analyze_upload(data, selection, chart_format=None, mode=DEFAULT_MODE):
+    # com muitas análises em andamento ou lentas, usar um modo mais rápido
+    used = mode_selector.choose(mode, cpu_pool.pending + jobs.queue_depth())
+    start = time.perf_counter()
+    with metrics.analysis():
+        with metrics.stage("decode"):
+            img_array = await cpu_pool.run(decode_image, data)
+        result = await run_analysis(img_array, selection, used)
+        mode_selector.observe(time.perf_counter() - start)
+        result = dict(result, mode=used, degraded=used != mode)
+        if chart_format:
+            with metrics.stage("chart"):
+                result = await cpu_pool.run(with_chart, result, chart_format)
+    return result
+
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request: Request, exc: PoolSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Servidor ocupado, tente novamente em instantes"},
+        headers={"Retry-After": str(RETRY_AFTER)},
+    )
+
+
+@app.exception_handler(NotReady)
+async def not_ready_handler(request: Request, exc: NotReady):
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Servidor iniciando, tente novamente em instantes"},
+        headers={"Retry-After": str(RETRY_AFTER)},
+    )
+
+
+@app.exception_handler(QueueFull)
+async def queue_full_handler(request: Request, exc: QueueFull):
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Fila de análises cheia, tente novamente em instantes"},
+        headers={"Retry-After": str(RETRY_AFTER)},
+    )
+
+
+@app.exception_handler(UnknownCollection)
+async def unknown_collection_handler(request: Request, exc: UnknownCollection):
+    return JSONResponse(status_code=404, content={"error": f"Coleção desconhecida: {exc.args[0]}"})
+
+
+@app.exception_handler(ImageTooLarge)
+async def image_too_large_handler(request: Request, exc: ImageTooLarge):
+    return JSONResponse(status_code=413, content={"error": str(exc)})
+
+
+@app.exception_handler(InvalidImage)
+async def invalid_image_handler(request: Request, exc: InvalidImage):
+    return JSONResponse(status_code=400, content={"error": str(exc)})
+
+
+# Coleções existentes, mas sem nenhuma referência (diretório vazio ou ausente)
+
+
+def check_references(selection, names):
+    if not selection_size(selection):
+        raise HTTPException(
+            status_code=503,
+            detail=f"Nenhuma imagem de referência nas coleções {', '.join(names)}")
+
+# Coleções pedidas (nomes separados por vírgula); vazio = DEFAULT_SELECTION
+
+
+def select_collections(value):
+    return parse_selection(value, configured_collections, DEFAULT_SELECTION)
 
 
 @app.post("/analyze", response_model=AnalysisResult)
 async def analyze_notification(
     file: UploadFile = File(...),
-    reference_dir: str = Form(r"C:\proj_notific_fake\data\real")
+    collections: str = Form(""),
+    mode: str = Form(""),
+    include_chart: bool = Form(False),
+    chart_format: str = Form("svg")
 ):
-    # Verificar se o diretório de referência existe
-    if not os.path.exists(reference_dir):
-        return {"error": f"Diretório {reference_dir} não encontrado"}
+    check_ready()
+    chart_format = check_chart_format(include_chart, chart_format)
+    mode = check_mode(mode)
+    names = select_collections(collections)
 
-    # Listar arquivos de imagem no diretório
-    image_files = [f for f in os.listdir(reference_dir)
-                   if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    with cpu_pool.admit():
+        # Características das referências vêm dos índices já montados (sem recalcular o VGG16)
+        with metrics.stage("index"):
+            selection = await cpu_pool.run(get_selection, names)
 
-    if not image_files:
-        return {"error": f"Nenhuma imagem de referência encontrada em {reference_dir}"}
+        check_references(selection, names)
 
-    # Salvar o arquivo enviado temporariamente
-    temp_file = f"temp_{file.filename}"
-    with open(temp_file, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+        # Processar a imagem direto da memória, sem arquivo temporário
+        with metrics.stage("upload"):
+            data = await read_upload(file)
+        return await analyze_upload(data, selection, chart_format, mode)
 
-    try:
-        # Processar a imagem
-        image = Image.open(temp_file)
-        img_array = np.array(image)
-
-        # Converter para BGR (formato OpenCV)
-        if len(img_array.shape) == 3 and img_array.shape[2] == 3:
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        elif len(img_array.shape) == 2:
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2BGR)
-
-        # Extrair características da imagem carregada
-        features_uploaded = extract_features(img_array, model)
-
-        # Inicializar variáveis para acompanhar a melhor correspondência
-        best_match_score = 0
-        best_match_file = None
-        best_match_image = None
-        best_ssim_score = 0
-        best_similarity_score = 0
-
-        # Comparar com todas as imagens de referência
-        for image_file in image_files:
-            file_path = os.path.join(reference_dir, image_file)
-            ref_img = cv2.imread(file_path)
-
-            if ref_img is None:
-                continue
-
-            # Extrair características da imagem de referência
-            features_ref = extract_features(ref_img, model)
-
-            # Calcular similaridade entre características
-            similarity_score = compare_features(
-                features_uploaded, features_ref)
-
-            # Calcular similaridade estrutural (SSIM)
-            ssim_score = compare_images_ssim(img_array, ref_img)
-
-            # Calcular pontuação combinada (média ponderada)
-            combined_score = 0.7 * similarity_score + 0.3 * ssim_score
-
-            # Atualizar melhor correspondência
-            if combined_score > best_match_score:
-                best_match_score = combined_score
-                best_match_file = image_file
-                best_match_image = ref_img
-                best_ssim_score = ssim_score
-                best_similarity_score = similarity_score
-
-        # Definir limiar para classificação
-        threshold = 0.65
-
-        # Calcular confiança em porcentagem
-        confidence = best_match_score * 100
-
-        # Determinar resultado
-        is_authentic = best_match_score > threshold
-
-        # Criar gráfico de confiança
-        confidence_chart = create_confidence_chart(confidence, threshold)
-
-        # Retornar resultado
-        result = {
-            "is_authentic": is_authentic,
-            "confidence": confidence,
-            "confidence_chart": confidence_chart,
-            "combined_score": best_match_score,
-            "visual_similarity": best_ssim_score,
-            "semantic_similarity": best_similarity_score,
-            "best_match_file": best_match_file
-        }
 
-        return result
+# Analisar várias imagens, devolvendo uma linha JSON por imagem assim que termina.
+# As imagens são processadas em paralelo, então decodificação e VGG16 compartilham lotes
+
+
+async def stream_batch(items, selection, slot, chart_format=None, mode=DEFAULT_MODE):
+    concurrency = asyncio.Semaphore(max(BATCH_SIZE, cpu_pool.max_workers * 2))
 
+    async def analyze_item(name, data):
+        async with concurrency:
+            try:
+                result = await analyze_upload(data, selection, chart_format, mode)
+                return BatchAnalysisResult(filename=name, **result).model_dump_json()
+            except Exception as e:
+                return json.dumps({"filename": name, "error": str(e)})
+
+    tasks = [asyncio.create_task(analyze_item(name, data)) for name, data in items]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task + "\n"
     finally:
-        # Limpar o arquivo temporário
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
+        # cliente desconectou: cancelar o que ainda não terminou
+        for task in tasks:
+            task.cancel()
+        slot.release()
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    collections: str = Form(""),
+    mode: str = Form(""),
+    include_chart: bool = Form(False),
+    chart_format: str = Form("svg")
+):
+    check_ready()
+    chart_format = check_chart_format(include_chart, chart_format)
+    mode = check_mode(mode)
+    names = select_collections(collections)
+
+    items = [(f.filename, await read_upload(f)) for f in files or []]
+    if archive is not None:
+        data = await read_upload(archive, MAX_ARCHIVE_BYTES)
+        items.extend(read_archive(archive.filename, data, MAX_BATCH_FILES - len(items)))
+
+    if not items:
+        raise HTTPException(status_code=400, detail="Nenhuma imagem enviada")
+    if len(items) > MAX_BATCH_FILES:
+        raise too_many_files()
+
+    # a vaga é liberada pelo gerador quando o streaming termina. Se o corpo nunca
+    # chegar a ser percorrido (cliente desconectou antes), o finally do gerador não
+    # roda: a tarefa de fundo e a coleta do gerador liberam a vaga no lugar dele
+    slot = cpu_pool.reserve()
+    try:
+        selection = await cpu_pool.run(get_selection, names)
+        check_references(selection, names)
+        body = stream_batch(items, selection, slot, chart_format, mode)
+        weakref.finalize(body, slot.release)
+    except BaseException:
+        slot.release()
+        raise
+
+    return StreamingResponse(body, media_type="application/x-ndjson",
+                             background=BackgroundTask(slot.release))
+
+
+# Job assíncrono: a imagem é lida agora, a análise roda quando um worker da fila estiver livre
+
+
+async def run_job(data, names, chart_format, mode):
+    selection = await cpu_pool.run(get_selection, names)
+    if not selection_size(selection):
+        raise ValueError(f"Nenhuma imagem de referência nas coleções {', '.join(names)}")
+    return await analyze_upload(data, selection, chart_format, mode)
+
+
+@app.post("/jobs", status_code=202, response_model=JobStatus)
+async def create_job(
+    file: UploadFile = File(...),
+    collections: str = Form(""),
+    mode: str = Form(""),
+    include_chart: bool = Form(False),
+    chart_format: str = Form("svg")
+):
+    check_ready()
+    chart_format = check_chart_format(include_chart, chart_format)
+    mode = check_mode(mode)
+    names = select_collections(collections)
+    data = await read_upload(file)
+    return jobs.submit(run_job, data, names, chart_format, mode)
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+    return job
+
+
+@app.post("/index/refresh")
+async def refresh_index(collections: str = Form("")):
+    check_ready()
+    refreshed = {}
+    for name in select_collections(collections):
+        if not os.path.isdir(configured_collections[name]["dir"]):
+            refreshed[name] = {"error": "Diretório da coleção não encontrado"}
+            continue
+        snapshot = (await cpu_pool.run(get_reference_index, name, True)).snapshot
+        refreshed[name] = {"images": len(snapshot), "version": snapshot.version,
+                           "refreshed_at": snapshot.refreshed_at}
+    return refreshed
+
+
+@app.get("/collections")
+async def list_collections():
+    return {name: {"description": collection["description"],
+                   "default": name in DEFAULT_SELECTION,
+                   "images": (len(reference_indexes[name].snapshot)
+                              if name in reference_indexes else None)}
+            for name, collection in configured_collections.items()}
+
+
+# Liveness: o processo está de pé e a inicialização não falhou (não espera o modelo)
+
+
+@app.get("/health")
+async def health():
+    if startup_state["error"]:
+        return JSONResponse(status_code=500,
+                            content={"status": "error", "error": startup_state["error"]})
+    return {"status": "ok"}
+
+
+# Readiness: modelo carregado, aquecido e índices prontos; 503 até lá
+
+
+@app.get("/ready")
+async def ready():
+    return JSONResponse(status_code=200 if startup_state["ready"] else 503,
+                        content=startup_state)
+
+
+@app.get("/stats")
+async def stats():
+    return {"backend": backend.name if backend else None,
+            "parity": parity_report,
+            "batching": batcher.stats() if batcher else None,
+            "cpu_pool": cpu_pool.stats(),
+            "result_cache": result_cache.stats(),
+            "phash": dict(phash_stats, seen_uploads=len(seen_uploads)),
+            "charts": chart_cache_stats(),
+            "jobs": jobs.stats(),
+            "modes": mode_selector.stats(),
+            "watcher": watcher.stats() if watcher is not None else None,
+            "references": {
+                index.collection: {
+                    "reference_dir": index.reference_dir,
+                    "images": len(index.snapshot),
+                    "version": index.snapshot.version,
+                    "refreshed_at": index.snapshot.refreshed_at,
+                    "watched": index.watched,
+                    "shared": index.shared,
+                    "matrix_bytes": index.snapshot.matrix.nbytes,
+                    "ann": ({"nlist": len(index.snapshot.ann.centroids),
+                             "nprobe": index.snapshot.ann.nprobe}
+                            if index.snapshot.ann is not None else None),
+                    "compact": (index.snapshot.encoder.describe()
+                                if index.snapshot.encoder is not None else None),
+                } for index in list(reference_indexes.values())}}
+
+
+# Estado dos demais componentes, lido no momento da coleta
+
+
+@metrics.collector
+def component_metrics():
+    cache = result_cache.stats()
+    charts = chart_cache_stats()
+    pool = cpu_pool.stats()
+    lookups = phash_stats["reference_hits"] + phash_stats["upload_hits"] + phash_stats["misses"]
+    return [
+        ("batch_queue_depth", "gauge", "Imagens aguardando o forward pass do VGG16",
+         [({}, batcher.queue_depth() if batcher else 0)]),
+        ("batches_total", "counter", "Forward passes do VGG16",
+         [({}, batcher.batches if batcher else 0)]),
+        ("batched_images_total", "counter", "Imagens processadas pelo VGG16",
+         [({}, batcher.items if batcher else 0)]),
+        ("job_queue_depth", "gauge", "Jobs aguardando um worker",
+         [({}, jobs.queue_depth())]),
+        ("jobs_rejected_total", "counter", "Jobs recusados com a fila cheia",
+         [({}, jobs.rejected)]),
+        ("analyses_total", "counter", "Análises por modo usado",
+         [({"mode": mode}, count) for mode, count in mode_selector.stats()["used"].items()]),
+        ("degraded_total", "counter", "Análises rebaixadas para um modo mais rápido pela carga",
+         [({}, mode_selector.degraded)]),
+        ("mode_steps_down", "gauge", "Níveis de rebaixamento aplicados no momento",
+         [({}, mode_selector.steps)]),
+        ("cpu_pool_pending", "gauge", "Requisições admitidas no pool de CPU",
+         [({}, pool["pending"])]),
+        ("cpu_pool_rejected_total", "counter", "Requisições recusadas com 503",
+         [({}, pool["rejected"])]),
+        ("cache_hits_total", "counter", "Acertos dos caches",
+         [({"cache": "result"}, cache["hits"]), ({"cache": "chart"}, charts["hits"]),
+          ({"cache": "phash"}, phash_stats["reference_hits"] + phash_stats["upload_hits"])]),
+        ("cache_misses_total", "counter", "Faltas dos caches",
+         [({"cache": "result"}, cache["misses"]), ({"cache": "chart"}, charts["misses"]),
+          ({"cache": "phash"}, phash_stats["misses"])]),
+        ("cache_hit_ratio", "gauge", "Taxa de acerto dos caches",
+         [({"cache": "result"}, cache["hit_rate"]),
+          ({"cache": "chart"}, charts["hits"] / max(charts["hits"] + charts["misses"], 1)),
+          ({"cache": "phash"}, (lookups - phash_stats["misses"]) / max(lookups, 1))]),
+        ("ready", "gauge", "1 quando o modelo e os índices estão prontos",
+         [({}, int(startup_state["ready"]))]),
+        ("startup_phase_seconds", "gauge", "Duração de cada fase da inicialização",
+         [({"phase": phase}, seconds) for phase, seconds in startup_state["phases"].items()]),
+        ("reference_images", "gauge", "Imagens no snapshot de referência atual",
+         [({"collection": index.collection}, len(index.snapshot))
+          for index in list(reference_indexes.values())]),
+    ]
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/")
 async def root():
     return {"message": "Bem-vindo à API do NotifiCheck. Use o endpoint /analyze para verificar notificações."}
 
+# rotas da API como (expressão, modelo), para rotular métricas como /jobs/{job_id}
+known_routes = [(route.path_regex, route.path) for route in app.routes
+                if hasattr(route, "path_regex")]
+
 if __name__ == "__main__":
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
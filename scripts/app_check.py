@@ -1,13 +1,37 @@
 import flet as ft
 import os
+import json
+import time
+import threading
 import requests
 import base64
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from PIL import Image
 from io import BytesIO
-import tempfile
 
 # endpoint da api
 API_URL = "http://127.0.0.1:8000/analyze"
+BATCH_URL = API_URL + "/batch"
+# coleções de referência do servidor usadas na análise (separadas por vírgula);
+# vazio = as coleções padrão da API
+COLLECTIONS = ""
+# tempo máximo (s) para conectar e para receber a resposta da análise
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 120
+# maior lado com que a API decodifica as imagens (NOTIFICHECK_DECODE_MAX_SIDE);
+# enviar mais pixels que isso só aumenta o upload
+UPLOAD_MAX_SIDE = 1024
+UPLOAD_JPEG_QUALITY = 90
+PREVIEW_WIDTH = 300
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png"}
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+# fila de várias imagens: imagens por chamada ao /analyze/batch, chamadas simultâneas,
+# tentativas quando a API responde 503 e intervalo mínimo (s) entre redesenhos da tabela
+QUEUE_CHUNK = 16
+QUEUE_CONCURRENCY = 2
+QUEUE_RETRIES = 3
+TABLE_REFRESH = 0.25
 
 # Cores que vamos usar
 PRIMARY_COLOR = "#6200EE"
@@ -19,11 +43,204 @@ ERROR_COLOR = "#F44336"
 NEUTRAL_COLOR = "#9E9E9E"
 
 
+# sessão reaproveitada entre as análises (keep-alive: sem novo handshake a cada envio)
+def build_session(pool_size=4):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# reduzir a imagem para a resolução que a API usa e recomprimir em JPEG;
+# se o arquivo original já for menor, ele é enviado como está
+def prepare_upload(path, max_side=UPLOAD_MAX_SIDE, quality=UPLOAD_JPEG_QUALITY):
+    with open(path, "rb") as f:
+        original = f.read()
+    img = Image.open(BytesIO(original))
+    original_format, original_size = img.format, img.size
+
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=quality)
+    shrunk = buffer.getvalue()
+
+    if max(original_size) <= max_side and len(original) <= len(shrunk):
+        return (os.path.basename(path), original,
+                MIME_TYPES.get(original_format, "application/octet-stream"))
+    name = os.path.splitext(os.path.basename(path))[0]
+    return f"{name}.jpg", shrunk, "image/jpeg"
+
+
+# miniatura para a tela, em memória (base64), sem arquivo temporário
+def preview_base64(path, max_width=PREVIEW_WIDTH):
+    img = Image.open(path)
+    if img.width > max_width:
+        img.thumbnail((max_width, img.height), Image.LANCZOS)
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+# imagens de uma pasta (e subpastas), em ordem
+def list_images(folder):
+    paths = []
+    for root, _, files in os.walk(folder):
+        for f in sorted(files):
+            if f.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, f))
+    return sorted(paths)
+
+
+# fila de análise de várias imagens, fora da thread da interface: as imagens vão
+# em grupos para o /analyze/batch (ou uma a uma no /analyze, se a API não tiver o
+# endpoint de lote), com no máximo `concurrency` chamadas ao mesmo tempo.
+# on_update(itens) é chamado a cada imagem concluída
+class AnalysisQueue:
+    def __init__(self, session, collections, on_update, chunk=QUEUE_CHUNK,
+                 concurrency=QUEUE_CONCURRENCY):
+        self.session = session
+        self.collections = collections
+        self.on_update = on_update
+        self.chunk = chunk
+        self.concurrency = concurrency
+        self.items = []
+        self.use_batch = True
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def start(self, paths):
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        self.items = [{"id": i, "path": path, "name": os.path.basename(path),
+                       "status": "Na fila", "result": None, "error": None}
+                      for i, path in enumerate(paths)]
+        executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                      thread_name_prefix="analysis-queue")
+        for start in range(0, len(self.items), self.chunk):
+            executor.submit(self._run_chunk, generation, self.items[start:start + self.chunk])
+        executor.shutdown(wait=False)
+        return self.items
+
+    # os grupos ainda não enviados são descartados; respostas em andamento são ignoradas
+    def cancel(self):
+        with self._lock:
+            self._generation += 1
+        cancelled = [item for item in self.items if item["status"] in ("Na fila", "Enviando")]
+        for item in cancelled:
+            item["status"] = "Cancelado"
+        self.on_update(cancelled)
+
+    def _current(self, generation):
+        return generation == self._generation
+
+    def pending(self):
+        return sum(1 for item in self.items if item["status"] in ("Na fila", "Enviando"))
+
+    def _finish(self, item, result=None, error=None):
+        if item["status"] == "Cancelado":
+            return
+        item["result"] = result
+        item["error"] = error
+        item["status"] = "Erro" if error else "Concluído"
+        self.on_update([item])
+
+    # enviar com novas tentativas quando a API está ocupada (503 + Retry-After)
+    def _post(self, url, **kwargs):
+        for attempt in range(QUEUE_RETRIES + 1):
+            response = self.session.post(url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+            if response.status_code != 503 or attempt == QUEUE_RETRIES:
+                return response
+            response.close()
+            time.sleep(float(response.headers.get("Retry-After", 2)))
+
+    def _run_chunk(self, generation, chunk):
+        if not self._current(generation):
+            return
+        for item in chunk:
+            item["status"] = "Enviando"
+        self.on_update(chunk)
+        data = {"collections": self.collections}
+        # o id na frente do nome identifica cada linha da resposta; um arquivo
+        # ilegível falha sozinho e os demais do grupo seguem para a API
+        uploads = {}
+        for item in chunk:
+            try:
+                name, content, mime = prepare_upload(item["path"])
+            except Exception as e:
+                self._finish(item, error=str(e))
+                continue
+            uploads[item["id"]] = (f"{item['id']:06d}-{name}", content, mime)
+        chunk = [item for item in chunk if item["id"] in uploads]
+        if not chunk:
+            return
+        try:
+            if self.use_batch:
+                files = [("files", uploads[item["id"]]) for item in chunk]
+                with self._post(BATCH_URL, files=files, data=data, stream=True) as response:
+                    if response.status_code in (404, 405):
+                        self.use_batch = False
+                    else:
+                        self._read_batch(generation, chunk, response)
+                        return
+
+            for item in chunk:
+                if not self._current(generation):
+                    return
+                response = self._post(API_URL, files={"file": uploads[item["id"]]}, data=data)
+                result = response.json() if response.status_code == 200 else None
+                if result is not None and "error" not in result:
+                    self._finish(item, result)
+                else:
+                    self._finish(item, error=(result or {}).get("error")
+                                 or f"Erro {response.status_code}")
+        except Exception as e:
+            if self._current(generation):
+                for item in chunk:
+                    if item["status"] == "Enviando":
+                        self._finish(item, error=str(e))
+
+    # linhas NDJSON chegam na ordem em que as imagens terminam
+    def _read_batch(self, generation, chunk, response):
+        by_id = {item["id"]: item for item in chunk}
+        if response.status_code != 200:
+            for item in chunk:
+                self._finish(item, error=f"Erro {response.status_code}")
+            return
+        for line in response.iter_lines():
+            if not self._current(generation):
+                return
+            if not line:
+                continue
+            row = json.loads(line)
+            if "filename" not in row:
+                # erro do lote inteiro (por exemplo, diretório de referência vazio)
+                for item in chunk:
+                    self._finish(item, error=row.get("error") or row.get("detail"))
+                return
+            item = by_id.get(int(row["filename"].split("-", 1)[0]))
+            if item is not None:
+                self._finish(item, row if "error" not in row else None, row.get("error"))
+        for item in chunk:
+            if item["status"] == "Enviando":
+                self._finish(item, error="Sem resposta da API")
+
+
 class NotifiCheckApp:
     def __init__(self):
         self.selected_file_path = None
         self.is_analyzing = False
-        self.reference_dir = r"C:\proj_notific_fake\data\real"
+        self.collections = COLLECTIONS
+        self.session = build_session()
+        # várias imagens selecionadas (arquivos ou pasta) vão para a fila
+        self.selected_paths = []
+        self.last_table_refresh = 0.0
+        # identifica a análise atual; cancelar troca o número e a resposta antiga é ignorada
+        self.analysis_id = 0
 
     def main(self, page: ft.Page):
         page.title = "NotifiCheck - Verificador de Notificações"
@@ -50,44 +267,47 @@ class NotifiCheckApp:
             italic=True,
         )
 
+        # várias imagens: mostrar só a quantidade, a análise vai para a fila
+        def select_many(paths):
+            self.selected_paths = paths
+            self.selected_file_path = None
+            selected_file.value = f"{len(paths)} imagens selecionadas"
+            selected_image.visible = False
+            analyze_btn.disabled = not paths
+            page.update()
+
         # arquivos para selecionar a imagem
         def on_file_picked(e: ft.FilePickerResultEvent):
-            if e.files and len(e.files) > 0:
+            if e.files and len(e.files) > 1:
+                select_many([f.path for f in e.files])
+            elif e.files and len(e.files) > 0:
+                self.selected_paths = []
                 self.selected_file_path = e.files[0].path
                 selected_file.value = f"Arquivo selecionado: {os.path.basename(self.selected_file_path)}"
 
                 # Exibir a imagem
-                with open(self.selected_file_path, "rb") as f:
-                    image_bytes = f.read()
-                    img = Image.open(BytesIO(image_bytes))
-
-                    max_width = 300
-                    if img.width > max_width:
-                        ratio = max_width / img.width
-                        new_height = int(img.height * ratio)
-                        img = img.resize((max_width, new_height))
-
-                    # Salvar em arquivo temporário
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp:
-                        img.save(temp.name)
-                        temp_path = temp.name
-
-                selected_image.src = temp_path
+                selected_image.src_base64 = preview_base64(self.selected_file_path)
                 selected_image.visible = True
 
                 analyze_btn.disabled = False
 
                 page.update()
 
+        def on_folder_picked(e: ft.FilePickerResultEvent):
+            if e.path:
+                select_many(list_images(e.path))
+
         file_picker = ft.FilePicker(on_result=on_file_picked)
+        folder_picker = ft.FilePicker(on_result=on_folder_picked)
         page.overlay.append(file_picker)
+        page.overlay.append(folder_picker)
 
         pick_files_btn = ft.ElevatedButton(
-            "Selecionar imagem",
+            "Selecionar imagens",
             icon=ft.icons.UPLOAD_FILE,
             on_click=lambda _: file_picker.pick_files(
                 allowed_extensions=["png", "jpg", "jpeg"],
-                allow_multiple=False
+                allow_multiple=True
             ),
             style=ft.ButtonStyle(
                 bgcolor=PRIMARY_COLOR,
@@ -96,6 +316,13 @@ class NotifiCheckApp:
             height=50,
         )
 
+        pick_folder_btn = ft.OutlinedButton(
+            "Selecionar pasta",
+            icon=ft.icons.FOLDER_OPEN,
+            on_click=lambda _: folder_picker.get_directory_path(),
+            height=50,
+        )
+
         selected_file = ft.Text("Nenhum arquivo selecionado", size=14)
 
         # preview da imagem
@@ -135,133 +362,261 @@ class NotifiCheckApp:
             )
         )
 
-        # analisnado a iamgem
-        def analyze_image(e):
-            if not self.selected_file_path:
-                return
-
-            progress_ring.visible = True
-            analyze_btn.disabled = True
-            result_section.visible = False
+        # Tabela da fila: uma linha por imagem, atualizada conforme as respostas chegam
+        queue_progress = ft.Text("", size=14)
+        queue_rows = {}
+
+        def result_label(item):
+            if item["result"] is None:
+                return item["error"] or ""
+            return "Autêntica" if item["result"]["is_authentic"] else "Suspeita"
+
+        # chaves de ordenação, na ordem das colunas
+        sort_keys = [
+            lambda item: item["name"].lower(),
+            lambda item: item["status"],
+            result_label,
+            lambda item: item["result"]["confidence"] if item["result"] else -1.0,
+            lambda item: (item["result"] or {}).get("best_match_file") or "",
+        ]
+
+        def update_row(item):
+            cells = queue_rows[item["id"]].cells
+            result = item["result"]
+            cells[1].content.value = item["status"]
+            cells[2].content.value = result_label(item)
+            cells[2].content.color = (
+                (SUCCESS_COLOR if result["is_authentic"] else ERROR_COLOR) if result
+                else ERROR_COLOR if item["error"] else None)
+            cells[3].content.value = f"{result['confidence']:.2f}%" if result else ""
+            cells[4].content.value = (result or {}).get("best_match_file") or ""
+
+        def sort_queue(e):
+            queue_table.sort_column_index = e.column_index
+            queue_table.sort_ascending = e.ascending
+            items = sorted(self.queue.items, key=sort_keys[e.column_index],
+                           reverse=not e.ascending)
+            queue_table.rows = [queue_rows[item["id"]] for item in items]
             page.update()
 
-            try:
-                with open(self.selected_file_path, "rb") as file:
-                    files = {"file": (os.path.basename(
-                        self.selected_file_path), file, "image/jpeg")}
-                    data = {"reference_dir": self.reference_dir}
-
-                    response = requests.post(API_URL, files=files, data=data)
+        queue_table = ft.DataTable(
+            columns=[
+                ft.DataColumn(ft.Text("Arquivo"), on_sort=sort_queue),
+                ft.DataColumn(ft.Text("Status"), on_sort=sort_queue),
+                ft.DataColumn(ft.Text("Resultado"), on_sort=sort_queue),
+                ft.DataColumn(ft.Text("Confiança"), numeric=True, on_sort=sort_queue),
+                ft.DataColumn(ft.Text("Referência"), on_sort=sort_queue),
+            ],
+            rows=[],
+        )
 
-                    if response.status_code == 200:
-                        result = response.json()
+        queue_section = ft.Container(
+            visible=False,
+            padding=20,
+            bgcolor=CARD_COLOR,
+            border_radius=10,
+            content=ft.Column(
+                spacing=10,
+                controls=[
+                    ft.Text("Fila de análise", size=20, weight=ft.FontWeight.BOLD),
+                    queue_progress,
+                    ft.Column(controls=[queue_table], scroll=ft.ScrollMode.AUTO, height=500),
+                ],
+            ),
+            shadow=ft.BoxShadow(
+                spread_radius=1,
+                blur_radius=10,
+                color=ft.colors.with_opacity(0.1, ft.colors.BLACK),
+            )
+        )
 
-                        result_color = SUCCESS_COLOR if result["is_authentic"] else ERROR_COLOR
+        # chamado pelas threads da fila; a tela é redesenhada no máximo a cada
+        # TABLE_REFRESH segundos (e sempre ao final), para centenas de itens
+        table_lock = threading.Lock()
+
+        def on_queue_update(items):
+            with table_lock:
+                for item in items:
+                    update_row(item)
+                pending = self.queue.pending()
+                now = time.monotonic()
+                if pending and now - self.last_table_refresh < TABLE_REFRESH:
+                    return
+                self.last_table_refresh = now
+                total = len(self.queue.items)
+                queue_progress.value = f"{total - pending}/{total} concluídas"
+                if not pending and self.is_analyzing:
+                    finish_analysis()
+                page.update()
 
-                        result_content = ft.Column(
-                            spacing=20,
-                            controls=[
-                                ft.Row(
-                                    alignment=ft.MainAxisAlignment.CENTER,
-                                    controls=[
-                                        ft.Icon(
-                                            ft.icons.CHECK_CIRCLE if result["is_authentic"] else ft.icons.ERROR,
-                                            size=50,
-                                            color=result_color
-                                        ),
-                                        ft.Text(
-                                            "Notificação Autêntica" if result["is_authentic"] else "Notificação Suspeita",
-                                            size=24,
-                                            weight=ft.FontWeight.BOLD,
-                                            color=result_color
-                                        )
-                                    ]
-                                ),
-                                ft.Container(
-                                    padding=10,
-                                    bgcolor=ft.colors.with_opacity(
-                                        0.1, result_color),
-                                    border_radius=10,
-                                    content=ft.Column(
-                                        spacing=10,
-                                        controls=[
-                                            ft.Text(
-                                                f"Confiança: {result['confidence']:.2f}%", size=16),
-                                            ft.Image(
-                                                src_base64=result["confidence_chart"],
-                                                width=400,
-                                                fit=ft.ImageFit.CONTAIN,
-                                            ),
-                                        ]
+        self.queue = AnalysisQueue(self.session, self.collections, on_queue_update)
+
+        def start_queue(paths):
+            queue_rows.clear()
+            for i, path in enumerate(paths):
+                queue_rows[i] = ft.DataRow(cells=[
+                    ft.DataCell(ft.Text(os.path.basename(path))),
+                    ft.DataCell(ft.Text("Na fila")),
+                    ft.DataCell(ft.Text("")),
+                    ft.DataCell(ft.Text("")),
+                    ft.DataCell(ft.Text("")),
+                ])
+            queue_table.rows = list(queue_rows.values())
+            queue_table.sort_column_index = None
+            queue_progress.value = f"0/{len(paths)} concluídas"
+            queue_section.visible = True
+            page.update()
+            self.queue.start(paths)
+
+        # trocar o conteúdo do painel de resultado
+        def show_result(content):
+            result_section.content.controls.pop()
+            result_section.content.controls.append(content)
+            result_section.visible = True
+
+        def finish_analysis():
+            self.is_analyzing = False
+            progress_ring.visible = False
+            cancel_btn.visible = False
+            analyze_btn.disabled = False
+
+        # roda fora da thread da interface; a tela só é atualizada se a análise
+        # ainda for a atual (não foi cancelada nem substituída por outra)
+        def run_analysis(analysis_id, path):
+            try:
+                # enviar a imagem já reduzida, pela sessão com conexão reaproveitada
+                name, content, mime = prepare_upload(path)
+                files = {"file": (name, content, mime)}
+                data = {"collections": self.collections,
+                        "include_chart": "true", "chart_format": "svg"}
+
+                response = self.session.post(API_URL, files=files, data=data,
+                                             timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+                if analysis_id != self.analysis_id:
+                    return
+                if response.status_code == 200:
+                    result = response.json()
+
+                    result_color = SUCCESS_COLOR if result["is_authentic"] else ERROR_COLOR
+
+                    result_content = ft.Column(
+                        spacing=20,
+                        controls=[
+                            ft.Row(
+                                alignment=ft.MainAxisAlignment.CENTER,
+                                controls=[
+                                    ft.Icon(
+                                        ft.icons.CHECK_CIRCLE if result["is_authentic"] else ft.icons.ERROR,
+                                        size=50,
+                                        color=result_color
+                                    ),
+                                    ft.Text(
+                                        "Notificação Autêntica" if result["is_authentic"] else "Notificação Suspeita",
+                                        size=24,
+                                        weight=ft.FontWeight.BOLD,
+                                        color=result_color
                                     )
-                                ),
-                                ft.Divider(),
-                                ft.Text("Detalhes da análise",
-                                        weight=ft.FontWeight.BOLD, size=18),
-                                ft.DataTable(
-                                    columns=[
-                                        ft.DataColumn(ft.Text("Métrica")),
-                                        ft.DataColumn(ft.Text("Valor")),
-                                    ],
-                                    rows=[
-                                        ft.DataRow(
-                                            cells=[
-                                                ft.DataCell(
-                                                    ft.Text("Pontuação combinada")),
-                                                ft.DataCell(
-                                                    ft.Text(f"{result['combined_score']:.4f}")),
-                                            ]
-                                        ),
-                                        ft.DataRow(
-                                            cells=[
-                                                ft.DataCell(
-                                                    ft.Text("Similaridade visual ")),
-                                                ft.DataCell(
-                                                    ft.Text(f"{result['visual_similarity']:.4f}")),
-                                            ]
-                                        ),
-                                        ft.DataRow(
-                                            cells=[
-                                                ft.DataCell(
-                                                    ft.Text("Similaridade semântica")),
-                                                ft.DataCell(
-                                                    ft.Text(f"{result['semantic_similarity']:.4f}")),
-                                            ]
-                                        ),
-                                    ],
-                                ),
-                            ]
-                        )
-
-                        # Update the result section
-                        result_section.content.controls.pop()  # Remove placeholder
-                        result_section.content.controls.append(result_content)
-                        result_section.visible = True
-
-                    else:
-                        # Display error
-                        error_content = ft.Column(
-                            spacing=10,
-                            controls=[
-                                ft.Row(
-                                    alignment=ft.MainAxisAlignment.CENTER,
+                                ]
+                            ),
+                            ft.Container(
+                                padding=10,
+                                bgcolor=ft.colors.with_opacity(
+                                    0.1, result_color),
+                                border_radius=10,
+                                content=ft.Column(
+                                    spacing=10,
                                     controls=[
-                                        ft.Icon(ft.icons.ERROR, size=50,
-                                                color=ERROR_COLOR),
                                         ft.Text(
-                                            "Erro na análise", size=24, weight=ft.FontWeight.BOLD, color=ERROR_COLOR)
+                                            f"Confiança: {result['confidence']:.2f}%", size=16),
+                                        ft.Image(
+                                            src_base64=result["confidence_chart"],
+                                            width=400,
+                                            fit=ft.ImageFit.CONTAIN,
+                                        ),
                                     ]
-                                ),
-                                ft.Text(
-                                    f"Erro: {response.status_code}"),
-                                ft.Text(response.text),
-                            ]
-                        )
-                        result_section.content.controls.pop()
-                        result_section.content.controls.append(error_content)
-                        result_section.visible = True
+                                )
+                            ),
+                            ft.Divider(),
+                            ft.Text("Detalhes da análise",
+                                    weight=ft.FontWeight.BOLD, size=18),
+                            ft.DataTable(
+                                columns=[
+                                    ft.DataColumn(ft.Text("Métrica")),
+                                    ft.DataColumn(ft.Text("Valor")),
+                                ],
+                                rows=[
+                                    ft.DataRow(
+                                        cells=[
+                                            ft.DataCell(
+                                                ft.Text("Pontuação combinada")),
+                                            ft.DataCell(
+                                                ft.Text(f"{result['combined_score']:.4f}")),
+                                        ]
+                                    ),
+                                    ft.DataRow(
+                                        cells=[
+                                            ft.DataCell(
+                                                ft.Text("Similaridade visual ")),
+                                            ft.DataCell(
+                                                ft.Text(f"{result['visual_similarity']:.4f}"
+                                                        if result.get("visual_similarity") is not None
+                                                        else "—")),
+                                        ]
+                                    ),
+                                    ft.DataRow(
+                                        cells=[
+                                            ft.DataCell(
+                                                ft.Text("Similaridade semântica")),
+                                            ft.DataCell(
+                                                ft.Text(f"{result['semantic_similarity']:.4f}")),
+                                        ]
+                                    ),
+                                    ft.DataRow(
+                                        cells=[
+                                            ft.DataCell(
+                                                ft.Text("Modo da análise")),
+                                            ft.DataCell(
+                                                ft.Text((result.get("mode") or "—")
+                                                        + (" (rebaixado pela carga)"
+                                                           if result.get("degraded") else ""))),
+                                        ]
+                                    ),
+                                ],
+                            ),
+                        ]
+                    )
+
+                    # Update the result section
+                    show_result(result_content)
+
+                else:
+                    # Display error
+                    error_content = ft.Column(
+                        spacing=10,
+                        controls=[
+                            ft.Row(
+                                alignment=ft.MainAxisAlignment.CENTER,
+                                controls=[
+                                    ft.Icon(ft.icons.ERROR, size=50,
+                                            color=ERROR_COLOR),
+                                    ft.Text(
+                                        "Erro na análise", size=24, weight=ft.FontWeight.BOLD, color=ERROR_COLOR)
+                                ]
+                            ),
+                            ft.Text(
+                                f"Erro: {response.status_code}"),
+                            ft.Text(response.text),
+                        ]
+                    )
+                    show_result(error_content)
 
             except Exception as e:
+                if analysis_id != self.analysis_id:
+                    return
+                if isinstance(e, requests.Timeout):
+                    message = f"A API não respondeu em {READ_TIMEOUT} segundos"
+                else:
+                    message = f"Não foi possível conectar à API: {str(e)}"
 
                 error_content = ft.Column(
                     spacing=10,
@@ -275,20 +630,58 @@ class NotifiCheckApp:
                                         weight=ft.FontWeight.BOLD, color=ERROR_COLOR)
                             ]
                         ),
-                        ft.Text(f"Não foi possível conectar à API: {str(e)}"),
+                        ft.Text(message),
                         ft.Text(
                             "Verifique se o servidor está em execução."),
                     ]
                 )
-                result_section.content.controls.pop()
-                result_section.content.controls.append(error_content)
-                result_section.visible = True
+                show_result(error_content)
 
             finally:
+                if analysis_id == self.analysis_id:
+                    finish_analysis()
+                    page.update()
 
-                progress_ring.visible = False
-                analyze_btn.disabled = False
-                page.update()
+        # analisnado a iamgem
+        def analyze_image(e):
+            if self.is_analyzing or not (self.selected_file_path or self.selected_paths):
+                return
+
+            if self.selected_paths:
+                self.is_analyzing = True
+                progress_ring.visible = True
+                cancel_btn.visible = True
+                analyze_btn.disabled = True
+                result_section.visible = False
+                start_queue(self.selected_paths)
+                return
+
+            self.analysis_id += 1
+            self.is_analyzing = True
+            progress_ring.visible = True
+            cancel_btn.visible = True
+            analyze_btn.disabled = True
+            result_section.visible = False
+            page.update()
+
+            page.run_thread(run_analysis, self.analysis_id, self.selected_file_path)
+
+        # a requisição em andamento termina em segundo plano (limitada pelo timeout)
+        # e a resposta é descartada
+        def cancel_analysis(e):
+            self.analysis_id += 1
+            if self.queue.pending():
+                self.queue.cancel()
+            finish_analysis()
+            page.update()
+
+        cancel_btn = ft.OutlinedButton(
+            "Cancelar",
+            icon=ft.icons.CLOSE,
+            on_click=cancel_analysis,
+            visible=False,
+            height=50,
+        )
 
         # Bora de analisar
         analyze_btn = ft.ElevatedButton(
@@ -345,8 +738,9 @@ class NotifiCheckApp:
                                                 spacing=20,
                                                 controls=[
                                                     ft.Text(
-                                                        "Selecione uma imagem", size=18, weight=ft.FontWeight.BOLD),
+                                                        "Selecione as imagens", size=18, weight=ft.FontWeight.BOLD),
                                                     pick_files_btn,
+                                                    pick_folder_btn,
                                                     selected_file,
                                                     ft.Divider(),
                                                     ft.Container(
@@ -356,7 +750,7 @@ class NotifiCheckApp:
                                                     ),
                                                     ft.Row(
                                                         controls=[
-                                                            analyze_btn, progress_ring],
+                                                            analyze_btn, cancel_btn, progress_ring],
                                                         alignment=ft.MainAxisAlignment.CENTER,
                                                     ),
                                                 ],
@@ -377,6 +771,7 @@ class NotifiCheckApp:
                                     spacing=20,
                                     controls=[
                                         result_section,
+                                        queue_section,
                                     ],
                                 ),
                             ],
@@ -0,0 +1,79 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
+
+
+# agrupa imagens de requisições simultâneas em um único forward pass do modelo:
+# espera até max_batch imagens ou max_wait_ms, o que vier primeiro
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch=16, max_wait_ms=5.0, on_batch=None):
+        self.predict_fn = predict_fn
+        # chamado com (tamanho do lote, segundos do forward pass) após cada lote
+        self.on_batch = on_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.fill_histogram = [0] * (max_batch + 1)
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    # enviar um tensor já pré-processado; o Future recebe o vetor dessa imagem
+    def submit(self, tensor):
+        future = Future()
+        self._queue.put((tensor, future))
+        return future
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            futures = [f for _, f in batch]
+            start = time.perf_counter()
+            try:
+                outputs = self.predict_fn(np.stack([t for t, _ in batch]))
+                for future, output in zip(futures, outputs):
+                    future.set_result(output.flatten())
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            if self.on_batch is not None:
+                self.on_batch(len(batch), time.perf_counter() - start)
+
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.fill_histogram[len(batch)] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+                "fill_histogram": {str(size): count for size, count
+                                   in enumerate(self.fill_histogram) if count},
+                "queue_depth": self.queue_depth(),
+            }
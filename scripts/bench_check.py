@@ -0,0 +1,492 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+# resoluções (largura x altura) de capturas de tela de celulares comuns
+PHONE_RESOLUTIONS = ((720, 1600), (1080, 2340), (1080, 2400), (1170, 2532), (1284, 2778))
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+# tipos de consulta: cópia recomprimida de uma referência, referência com o valor
+# alterado (fraude típica) e notificação sem referência correspondente
+QUERY_KINDS = ("copy", "edited", "unrelated")
+# métricas comparadas entre execuções: latência (maior é pior) e vazão (menor é pior)
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+THROUGHPUT_METRICS = ("rps",)
+
+# as fontes Hershey do OpenCV só desenham ASCII, por isso os textos não têm acentos
+APPS = ("Banco Azul", "PagFacil", "Carteira", "Nubanco", "Caixa Facil", "Pix")
+TITLES = ("Pix recebido", "Transferencia recebida", "Pagamento aprovado",
+          "Deposito confirmado", "Compra no debito")
+SENDERS = ("Maria Souza", "Joao Lima", "Ana Pereira", "Carlos Dias", "Loja Central",
+           "Pedro Alves", "Julia Costa")
+
+
+def _money(rng):
+    value = rng.integers(100, 500000) / 100
+    return "R$ " + f"{value:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+# descrição de uma captura sintética; render() a desenha de forma determinística
+def notification_spec(rng):
+    width, height = PHONE_RESOLUTIONS[rng.integers(len(PHONE_RESOLUTIONS))]
+    cards = []
+    for _ in range(rng.integers(1, 4)):
+        cards.append({
+            "app": APPS[rng.integers(len(APPS))],
+            "title": TITLES[rng.integers(len(TITLES))],
+            "body": f"{_money(rng)} de {SENDERS[rng.integers(len(SENDERS))]}",
+            "minutes": int(rng.integers(0, 60)),
+            "icon": [int(c) for c in rng.integers(0, 256, 3)],
+        })
+    return {
+        "width": int(width), "height": int(height),
+        "top": [int(c) for c in rng.integers(0, 256, 3)],
+        "bottom": [int(c) for c in rng.integers(0, 256, 3)],
+        "clock": f"{rng.integers(0, 24):02d}:{rng.integers(0, 60):02d}",
+        "dark": bool(rng.integers(2)),
+        "noise_seed": int(rng.integers(2 ** 31)),
+        "cards": cards,
+    }
+
+
+def render(spec):
+    width, height = spec["width"], spec["height"]
+    scale = width / 1080
+    # papel de parede: degradê vertical com um pouco de ruído
+    t = np.linspace(0, 1, height, dtype=np.float32)[:, None, None]
+    img = (1 - t) * np.array(spec["top"], np.float32) + t * np.array(spec["bottom"], np.float32)
+    img = np.broadcast_to(img, (height, width, 3)).copy()
+    img += np.random.default_rng(spec["noise_seed"]).normal(0, 4, img.shape).astype(np.float32)
+    img = np.clip(img, 0, 255).astype(np.uint8)
+
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    # barra de status
+    bar = int(70 * scale)
+    img[:bar] = (img[:bar] * 0.6).astype(np.uint8)
+    cv2.putText(img, spec["clock"], (int(40 * scale), int(50 * scale)), font, 1.2 * scale,
+                (255, 255, 255), max(1, int(2 * scale)), cv2.LINE_AA)
+    for i in range(3):
+        x = width - int((60 + 50 * i) * scale)
+        cv2.rectangle(img, (x, int(22 * scale)), (x + int(30 * scale), int(48 * scale)),
+                      (255, 255, 255), -1)
+
+    card_bg = (40, 40, 40) if spec["dark"] else (245, 245, 245)
+    text = (235, 235, 235) if spec["dark"] else (30, 30, 30)
+    muted = (160, 160, 160) if spec["dark"] else (110, 110, 110)
+    margin, card_h, gap = int(30 * scale), int(230 * scale), int(24 * scale)
+    y = int(140 * scale)
+    for card in spec["cards"]:
+        x0, x1 = margin, width - margin
+        r = int(36 * scale)
+        # cartão com cantos arredondados
+        cv2.rectangle(img, (x0 + r, y), (x1 - r, y + card_h), card_bg, -1)
+        cv2.rectangle(img, (x0, y + r), (x1, y + card_h - r), card_bg, -1)
+        for cx, cy in ((x0 + r, y + r), (x1 - r, y + r), (x0 + r, y + card_h - r),
+                       (x1 - r, y + card_h - r)):
+            cv2.circle(img, (cx, cy), r, card_bg, -1, cv2.LINE_AA)
+        cv2.circle(img, (x0 + int(70 * scale), y + int(60 * scale)), int(28 * scale),
+                   tuple(card["icon"]), -1, cv2.LINE_AA)
+        cv2.putText(img, f"{card['app']}  -  {card['minutes']} min", (x0 + int(115 * scale),
+                    y + int(72 * scale)), font, 0.9 * scale, muted, max(1, int(2 * scale)),
+                    cv2.LINE_AA)
+        cv2.putText(img, card["title"], (x0 + int(40 * scale), y + int(140 * scale)), font,
+                    1.2 * scale, text, max(1, int(3 * scale)), cv2.LINE_AA)
+        cv2.putText(img, card["body"], (x0 + int(40 * scale), y + int(200 * scale)), font,
+                    1.0 * scale, text, max(1, int(2 * scale)), cv2.LINE_AA)
+        y += card_h + gap
+    return img
+
+
+def _edited(spec, rng):
+    spec = json.loads(json.dumps(spec))
+    card = spec["cards"][rng.integers(len(spec["cards"]))]
+    card["body"] = f"{_money(rng)} de {card['body'].split(' de ', 1)[1]}"
+    return spec
+
+
+# consulta "copy": a mesma captura reenviada em outra resolução e como JPEG
+def _recompressed(img, rng):
+    width, height = PHONE_RESOLUTIONS[rng.integers(len(PHONE_RESOLUTIONS))]
+    img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, int(rng.integers(70, 95))])
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+# corpus sintético reprodutível: refs/ com max(sizes) referências, sets/<n>/ com as
+# n primeiras (links), collections.json com uma coleção bench-<n> por conjunto e
+# queries/ com as consultas e seus rótulos em queries.json
+def generate_corpus(out_dir, sizes=DEFAULT_SIZES, queries=100, seed=0):
+    rng = np.random.default_rng(seed)
+    refs_dir = os.path.join(out_dir, "refs")
+    os.makedirs(refs_dir, exist_ok=True)
+    total = max(sizes)
+    specs = []
+    for i in range(total):
+        spec = notification_spec(rng)
+        specs.append(spec)
+        path = os.path.join(refs_dir, f"ref-{i:05d}.png")
+        if not os.path.exists(path):
+            cv2.imwrite(path, render(spec))
+        if (i + 1) % 500 == 0:
+            print(f"{i + 1}/{total} referências")
+
+    for size in sizes:
+        set_dir = os.path.join(out_dir, "sets", str(size))
+        os.makedirs(set_dir, exist_ok=True)
+        for i in range(size):
+            name = f"ref-{i:05d}.png"
+            if not os.path.exists(os.path.join(set_dir, name)):
+                _link_or_copy(os.path.join(refs_dir, name), os.path.join(set_dir, name))
+
+    # para o benchmark HTTP: NOTIFICHECK_COLLECTIONS=<out_dir>/collections.json no servidor
+    with open(os.path.join(out_dir, "collections.json"), "w") as f:
+        json.dump({collection_name(size): {"dir": os.path.join("sets", str(size)),
+                                           "description": f"{size} referências sintéticas"}
+                   for size in sizes}, f, indent=2)
+
+    # as consultas "copy" e "edited" partem das referências presentes no menor conjunto
+    query_dir = os.path.join(out_dir, "queries")
+    os.makedirs(query_dir, exist_ok=True)
+    labels = []
+    pool = min(sizes)
+    for i in range(queries):
+        kind = QUERY_KINDS[i % len(QUERY_KINDS)]
+        source = int(rng.integers(pool))
+        if kind == "copy":
+            img = _recompressed(render(specs[source]), rng)
+        elif kind == "edited":
+            img = render(_edited(specs[source], rng))
+        else:
+            img = render(notification_spec(rng))
+            source = None
+        name = f"query-{i:04d}.jpg"
+        cv2.imwrite(os.path.join(query_dir, name), img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        labels.append({"file": name, "kind": kind, "source": source})
+
+    with open(os.path.join(out_dir, "queries.json"), "w") as f:
+        json.dump({"seed": seed, "sizes": list(sizes), "queries": labels}, f, indent=2)
+    print(f"Corpus gerado em {out_dir}: {total} referências, {queries} consultas")
+
+
+def collection_name(size):
+    return f"bench-{size}"
+
+
+def load_queries(data_dir, limit=None):
+    with open(os.path.join(data_dir, "queries.json")) as f:
+        labels = json.load(f)["queries"][:limit]
+    return [(item, os.path.join(data_dir, "queries", item["file"])) for item in labels]
+
+
+def summarize(name, latencies, wall_time, **extra):
+    latencies = np.asarray(latencies, dtype=np.float64) * 1000
+    row = {"name": name, **extra, "count": int(len(latencies))}
+    if len(latencies):
+        row.update({
+            "mean_ms": float(latencies.mean()),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "rps": len(latencies) / wall_time if wall_time > 0 else 0.0,
+        })
+    return row
+
+
+def timed(fn, items, warmup=2):
+    for item in items[:warmup]:
+        fn(item)
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - start
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(),
+            "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "timestamp": time.time()}
+
+
+# chamadas diretas: extract_features, compare_images_ssim, SSIM por candidato
+# (skimage) x vetorizado e a busca completa (cosseno + SSIM) contra índices de
+# referência de cada tamanho
+def bench_inprocess(data_dir, sizes, backend_name="keras", queries=None, ssim_pairs=50,
+                    ssim_candidates=8, modes=("balanced",)):
+    from skimage.metrics import structural_similarity
+    from embedding import build_vgg16, load_backend, extract_features, load_sample
+    from reference_index import ReferenceIndex
+    from imaging import gray_thumbnail
+    import ssim_batch
+    import api_check
+
+    items = load_queries(data_dir, queries)
+    images = [cv2.imread(path) for _, path in items]
+    model = build_vgg16(api_check.VGG16_WEIGHTS)
+    representative = load_sample([path for _, path in items]) if backend_name == "tflite" else None
+    backend = load_backend(backend_name, model, representative=representative)
+    results = []
+
+    latencies, wall = timed(lambda img: extract_features(img, backend), images)
+    results.append(summarize("extract_features", latencies, wall, backend=backend.name))
+
+    ref_paths = [os.path.join(data_dir, "refs", f)
+                 for f in sorted(os.listdir(os.path.join(data_dir, "refs")))]
+    pairs = [(images[i % len(images)], cv2.imread(ref_paths[i % len(ref_paths)]))
+             for i in range(ssim_pairs)]
+    latencies, wall = timed(lambda pair: api_check.compare_images_ssim(*pair), pairs)
+    results.append(summarize("compare_images_ssim", latencies, wall))
+
+    # miniaturas canônicas: uma consulta contra ssim_candidates referências,
+    # uma a uma no skimage e de uma vez no SSIM vetorizado
+    query_thumbs = [gray_thumbnail(img, api_check.SSIM_SIZE) for img in images]
+    ref_thumbs = np.stack([gray_thumbnail(cv2.imread(path), api_check.SSIM_SIZE)
+                           for path in ref_paths[:ssim_candidates]])
+    latencies, wall = timed(
+        lambda q: [structural_similarity(q, r) for r in ref_thumbs], query_thumbs)
+    results.append(summarize("ssim_skimage", latencies, wall, candidates=len(ref_thumbs)))
+    latencies, wall = timed(
+        lambda q: ssim_batch.ssim_batch(ssim_batch.UploadStats(q), ref_thumbs), query_thumbs)
+    pairs = [(q, r) for q in query_thumbs for r in ref_thumbs][:ssim_pairs]
+    results.append(summarize("ssim_batch", latencies, wall, candidates=len(ref_thumbs),
+                             agreement=ssim_batch.agreement(pairs)))
+
+    features = [extract_features(img, backend) for img in images]
+    for size in sizes:
+        index = ReferenceIndex(
+            os.path.join(data_dir, "sets", str(size)), lambda img: extract_features(img, backend),
+            os.path.join(data_dir, "index_cache"), thumbnail_size=api_check.SSIM_SIZE)
+        start = time.perf_counter()
+        index.refresh()
+        print(f"Índice com {size} referências pronto em {time.perf_counter() - start:.1f}s")
+        selection = {collection_name(size): index.snapshot}
+        for mode in modes:
+            latencies, wall = timed(
+                lambda i: api_check.score_upload(images[i], features[i], selection, mode),
+                list(range(len(images))))
+            # balanced mantém o nome antigo para comparar com execuções anteriores
+            name = "score_upload" if mode == "balanced" else f"score_upload_{mode}"
+            results.append(summarize(name, latencies, wall, size=size, top_k=api_check.TOP_K))
+    return results
+
+
+# chamadas HTTP ao /analyze com N clientes simultâneos, cada um com sua sessão;
+# o servidor precisa conhecer as coleções bench-<n> do collections.json do corpus
+def bench_http(url, data_dir, sizes, concurrency=(1, 8, 32), requests_per_level=200,
+               timeout=120.0, warmup=5, mode="balanced"):
+    import requests
+
+    items = load_queries(data_dir)
+    payloads = []
+    for item, path in items:
+        with open(path, "rb") as f:
+            payloads.append((item["file"], f.read()))
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    def call(i, collection):
+        name, data = payloads[i % len(payloads)]
+        t0 = time.perf_counter()
+        try:
+            response = session().post(
+                url.rstrip("/") + "/analyze",
+                files={"file": (name, data, "image/jpeg")},
+                data={"collections": collection, "mode": mode, "include_chart": "false"},
+                timeout=timeout)
+            status = response.status_code
+            # modo realmente usado (a API pode rebaixar sob carga)
+            used = response.json().get("mode") if status == 200 else None
+        except requests.RequestException:
+            status, used = "error", None
+        return time.perf_counter() - t0, status, used
+
+    results = []
+    for size in sizes:
+        collection = collection_name(size)
+        for i in range(warmup):
+            call(i, collection)
+        for workers in concurrency:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                start = time.perf_counter()
+                outcomes = list(pool.map(lambda i: call(i, collection),
+                                         range(requests_per_level)))
+                wall = time.perf_counter() - start
+            statuses, modes = {}, {}
+            for _, status, used in outcomes:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if used:
+                    modes[used] = modes.get(used, 0) + 1
+            ok = [latency for latency, status, _ in outcomes if status == 200]
+            results.append(summarize("http_analyze", ok, wall, size=size, concurrency=workers,
+                                     statuses=statuses, modes=modes))
+            print(f"{size} referências, {workers} clientes: {statuses} {modes}")
+    return results
+
+
+def _key(row):
+    return (row.get("suite"), row["name"], row.get("size"), row.get("concurrency"))
+
+
+# comparar com uma execução anterior; regressão = piora relativa acima do limiar
+def compare(baseline, current, threshold=0.10):
+    previous = {_key(row): row for row in baseline["results"]}
+    regressions = []
+    rows = []
+    for row in current["results"]:
+        old = previous.get(_key(row))
+        if old is None:
+            continue
+        for metric in LATENCY_METRICS + THROUGHPUT_METRICS:
+            if metric not in row or not old.get(metric):
+                continue
+            change = (row[metric] - old[metric]) / old[metric]
+            worse = change > threshold if metric in LATENCY_METRICS else -change > threshold
+            entry = {"key": _key(row), "metric": metric, "baseline": old[metric],
+                     "current": row[metric], "change": change, "regression": worse}
+            rows.append(entry)
+            if worse:
+                regressions.append(entry)
+    return rows, regressions
+
+
+def print_comparison(rows, threshold):
+    for entry in rows:
+        suite, name, size, concurrency = entry["key"]
+        label = name + (f" n={size}" if size is not None else "") + \
+            (f" c={concurrency}" if concurrency is not None else "")
+        flag = "  REGRESSÃO" if entry["regression"] else ""
+        print(f"{label:<40} {entry['metric']:<7} {entry['baseline']:>10.2f} -> "
+              f"{entry['current']:>10.2f} ({entry['change']:+.1%}){flag}")
+    print(f"limiar: {threshold:.0%}")
+
+
+def _sizes(value):
+    return tuple(int(v) for v in value.split(","))
+
+
+def _write_report(path, suite, results, args):
+    for row in results:
+        row["suite"] = suite
+    report = {"suite": suite, "environment": environment(),
+              "args": {k: v for k, v in vars(args).items() if k != "command"},
+              "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    for row in results:
+        extra = "".join(f" {k}={row[k]}" for k in ("size", "concurrency", "candidates")
+                        if k in row)
+        if row["count"]:
+            print(f"{row['name']}{extra}: p50 {row['p50_ms']:.1f} ms  p95 {row['p95_ms']:.1f} ms  "
+                  f"p99 {row['p99_ms']:.1f} ms  {row['rps']:.1f} req/s")
+        else:
+            print(f"{row['name']}{extra}: nenhuma chamada bem-sucedida")
+        if "agreement" in row:
+            agreement = row["agreement"]
+            print(f"  concordância com o skimage em {agreement['pairs']} pares: diferença "
+                  f"máxima {agreement['max_abs_diff']:.2e}, média {agreement['mean_abs_diff']:.2e}")
+    print(f"Resultados salvos em {path}")
+    return report
+
+
+def _check(report, baseline_path, threshold):
+    if not baseline_path:
+        return 0
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    rows, regressions = compare(baseline, report, threshold)
+    print_comparison(rows, threshold)
+    return 1 if regressions else 0
+
+
+# python bench_check.py corpus bench_data --sizes 10,100,1000,10000
+# python bench_check.py inprocess bench_data --sizes 10,100 --out bench/atual.json
+# python bench_check.py http bench_data --url http://localhost:8000 --out bench/http.json
+# python bench_check.py compare bench/base.json bench/atual.json --threshold 0.1
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark reprodutível do pipeline de /analyze")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    corpus = commands.add_parser("corpus", help="gera o corpus sintético")
+    corpus.add_argument("data_dir")
+    corpus.add_argument("--sizes", type=_sizes, default=DEFAULT_SIZES)
+    corpus.add_argument("--queries", type=int, default=100)
+    corpus.add_argument("--seed", type=int, default=0)
+
+    for name in ("inprocess", "http"):
+        run = commands.add_parser(name)
+        run.add_argument("data_dir")
+        run.add_argument("--sizes", type=_sizes, default=(10, 100))
+        run.add_argument("--out", default=f"bench/{name}.json")
+        run.add_argument("--baseline", help="JSON de uma execução anterior para comparar")
+        run.add_argument("--threshold", type=float, default=0.10)
+        if name == "inprocess":
+            run.add_argument("--backend", default=os.environ.get("NOTIFICHECK_BACKEND", "keras"))
+            run.add_argument("--queries", type=int, default=None)
+            run.add_argument("--modes", type=lambda v: tuple(v.split(",")), default=("balanced",),
+                             help="modos de score_upload medidos, ex.: fast,balanced,thorough")
+        else:
+            run.add_argument("--url", default="http://localhost:8000")
+            run.add_argument("--concurrency", type=_sizes, default=(1, 8, 32))
+            run.add_argument("--requests", type=int, default=200)
+            run.add_argument("--mode", default="balanced", help="modo pedido ao /analyze")
+
+    cmp_parser = commands.add_parser("compare", help="compara duas execuções")
+    cmp_parser.add_argument("baseline")
+    cmp_parser.add_argument("current")
+    cmp_parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    if args.command == "corpus":
+        generate_corpus(args.data_dir, args.sizes, args.queries, args.seed)
+        return 0
+    if args.command == "compare":
+        with open(args.current) as f:
+            report = json.load(f)
+        return _check(report, args.baseline, args.threshold)
+
+    with open(os.path.join(args.data_dir, "queries.json")) as f:
+        available = set(json.load(f)["sizes"])
+    missing = [size for size in args.sizes if size not in available]
+    if missing:
+        print(f"Tamanhos sem conjunto gerado: {missing} (gere com o comando corpus)")
+        return 1
+    if args.command == "inprocess":
+        results = bench_inprocess(args.data_dir, args.sizes, args.backend, args.queries,
+                                  modes=args.modes)
+    else:
+        results = bench_http(args.url, args.data_dir, args.sizes, args.concurrency,
+                             args.requests, mode=args.mode)
+    report = _write_report(args.out, args.command, results, args)
+    return _check(report, args.baseline, args.threshold)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
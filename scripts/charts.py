@@ -0,0 +1,72 @@
+import io
+import base64
+from functools import lru_cache
+
+CHART_FORMATS = ("svg", "png")
+
+# modelo SVG do gráfico de confiança: barra horizontal, linha do limiar e eixo 0-100%
+SVG_TEMPLATE = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="500" height="90" viewBox="0 0 500 90" '
+    'font-family="sans-serif" font-size="11">'
+    '<rect width="500" height="90" fill="white"/>'
+    '<text x="8" y="32">Confiança</text>'
+    '<rect x="75" y="12" width="410" height="34" fill="none" stroke="#ccc"/>'
+    '<rect x="75" y="16" width="{bar:.1f}" height="26" fill="{color}"/>'
+    '<line x1="{limit:.1f}" y1="10" x2="{limit:.1f}" y2="48" stroke="green" '
+    'stroke-dasharray="5,3" stroke-opacity="0.7" stroke-width="1.5"/>'
+    '{ticks}'
+    '<text x="280" y="84" text-anchor="middle">Porcentagem (%)</text>'
+    '</svg>'
+)
+TICKS = "".join(
+    f'<text x="{75 + 4.1 * v:.1f}" y="62" text-anchor="middle">{v}</text>'
+    for v in range(0, 101, 20))
+
+
+def _color(confidence, threshold):
+    return 'blue' if confidence / 100 > threshold else 'red'
+
+
+def render_svg(confidence, threshold):
+    svg = SVG_TEMPLATE.format(
+        bar=4.1 * min(max(confidence, 0), 100),
+        limit=75 + 4.1 * threshold * 100,
+        color=_color(confidence, threshold),
+        ticks=TICKS)
+    return base64.b64encode(svg.encode()).decode()
+
+
+# matplotlib só é importado quando alguém pede o gráfico em PNG
+def render_png(confidence, threshold):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(5, 0.7))
+    ax = fig.subplots()
+    ax.barh(["Confiança"], [confidence], color=_color(confidence, threshold))
+    ax.axvline(x=threshold*100, color='green', linestyle='--', alpha=0.7)
+    ax.set_xlim(0, 100)
+    ax.set_xlabel('Porcentagem (%)')
+    ax.grid(True, alpha=0.3)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    buf.seek(0)
+
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+@lru_cache(maxsize=1024)
+def _cached_chart(confidence, threshold, chart_format):
+    if chart_format == "png":
+        return render_png(confidence, threshold)
+    return render_svg(confidence, threshold)
+
+
+# gráfico em base64; a confiança é arredondada para 0,5% para reaproveitar o cache
+def create_confidence_chart(confidence, threshold, chart_format="svg"):
+    return _cached_chart(round(confidence * 2) / 2, round(threshold, 3), chart_format)
+
+
+def cache_stats():
+    info = _cached_chart.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "entries": info.currsize}
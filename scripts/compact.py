@@ -0,0 +1,178 @@
+import os
+import sys
+import argparse
+import numpy as np
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+# linhas convertidas para float32 de cada vez ao calcular os produtos
+SCORE_BLOCK = 4096
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# média espacial da saída 7x7x512 do VGG16: 25.088 floats viram 512
+def global_pool(features, channels=512):
+    features = np.asarray(features, dtype=np.float32)
+    return features.reshape(len(features), -1, channels).mean(axis=1)
+
+
+# matriz de vetores normalizados guardada em float32, float16 ou int8 (com escala por linha)
+class EncodedMatrix:
+    def __init__(self, data, scales=None):
+        self.data = data
+        self.scales = scales
+
+    @classmethod
+    def encode(cls, vectors, dtype="float32"):
+        vectors = _normalize(vectors) if len(vectors) else np.asarray(vectors, dtype=np.float32)
+        if dtype == "float16":
+            return cls(vectors.astype(np.float16))
+        if dtype == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0 if len(vectors) \
+                else np.zeros(0, dtype=np.float32)
+            codes = np.round(vectors / scales[:, None]).astype(np.int8) if len(vectors) \
+                else np.zeros(vectors.shape, dtype=np.int8)
+            return cls(codes, scales.astype(np.float32))
+        return cls(vectors)
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def rows(self, start=0, stop=None):
+        block = self.data[start:stop].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:stop, None]
+        return block
+
+    # linhas escolhidas (ids), convertidas para float32
+    def take(self, ids):
+        block = self.data[ids].astype(np.float32, copy=False)
+        if self.scales is not None:
+            block = block * self.scales[ids, None]
+        return block
+
+    # produto com um vetor já normalizado (= cosseno), convertendo por blocos
+    def dot(self, query):
+        if self.data.dtype == np.float32:
+            return self.data @ query
+        scores = np.empty(len(self.data), dtype=np.float32)
+        for start in range(0, len(self.data), SCORE_BLOCK):
+            stop = start + SCORE_BLOCK
+            scores[start:stop] = self.rows(start, stop) @ query
+        return scores
+
+
+# representação compacta: pooling global, PCA opcional ajustada nas referências
+# e armazenamento em float16 ou int8. A PCA é feita sem centralizar os vetores
+# (SVD truncada), para que o cosseno projetado continue na mesma escala do
+# cosseno original, que é o que o limiar de 0.65 espera
+class CompactEncoder:
+    def __init__(self, components=128, dtype="float16"):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"dtype deve ser um de {', '.join(STORAGE_DTYPES)}")
+        self.components = components
+        self.dtype = dtype
+        self.projection = None
+        self.explained_variance = None
+
+    # ajustar a PCA nos vetores (já com pooling) das referências; devolve um novo encoder
+    def fit(self, pooled):
+        fitted = CompactEncoder(self.components, self.dtype)
+        pooled = np.asarray(pooled, dtype=np.float32)
+        k = min(self.components, len(pooled), pooled.shape[-1]) if pooled.ndim == 2 else 0
+        if k < 1:
+            return fitted
+        _, singular, vt = np.linalg.svd(pooled, full_matrices=False)
+        fitted.projection = vt[:k].T.astype(np.float32)
+        variance = singular ** 2
+        fitted.explained_variance = float(variance[:k].sum() / max(variance.sum(), 1e-12))
+        return fitted
+
+    def transform(self, pooled):
+        pooled = np.asarray(pooled, dtype=np.float32)
+        if self.projection is None:
+            return pooled
+        return pooled @ self.projection
+
+    def encode(self, pooled):
+        return EncodedMatrix.encode(self.transform(pooled), self.dtype)
+
+    def describe(self):
+        dims = self.projection.shape[1] if self.projection is not None else None
+        return {"components": dims, "dtype": self.dtype,
+                "explained_variance": self.explained_variance}
+
+
+def _cosine_matrix(vectors):
+    vectors = _normalize(vectors)
+    return vectors @ vectors.T
+
+
+# desvio da representação compacta em relação aos vetores completos: diferença
+# das similaridades entre as referências e concordância do vizinho mais próximo
+def drift_report(full, encoder):
+    full = np.asarray(full, dtype=np.float32).reshape(len(full), -1)
+    pooled = global_pool(full)
+    fitted = encoder.fit(pooled)
+    compact = fitted.encode(pooled).rows()
+
+    expected = _cosine_matrix(full)
+    actual = compact @ compact.T
+    np.fill_diagonal(expected, -np.inf)
+    np.fill_diagonal(actual, -np.inf)
+    mask = ~np.eye(len(full), dtype=bool)
+    error = np.abs(expected[mask] - actual[mask])
+
+    return {
+        "images": len(full),
+        "full_bytes_per_vector": full.shape[1] * 4,
+        "compact_bytes_per_vector": fitted.encode(pooled[:1]).nbytes,
+        "mean_abs_cosine_error": float(error.mean()) if error.size else 0.0,
+        "max_abs_cosine_error": float(error.max()) if error.size else 0.0,
+        "top1_agreement": float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1)))
+        if len(full) > 1 else 1.0,
+        **fitted.describe(),
+    }
+
+
+# python compact.py ./data/real --components 128 --dtype int8
+def main(argv=None):
+    from reference_index import IMAGE_EXTENSIONS
+    from embedding import build_vgg16, KerasBackend, load_sample
+
+    parser = argparse.ArgumentParser(
+        description="Mede o desvio da representação compacta em relação ao vetor completo")
+    parser.add_argument("reference_dir")
+    parser.add_argument("--components", type=int, default=128)
+    parser.add_argument("--dtype", choices=STORAGE_DTYPES, default="float16")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--weights", default=os.environ.get("NOTIFICHECK_VGG16_WEIGHTS"),
+                        help="arquivo local com os pesos do VGG16 (sem o topo)")
+    args = parser.parse_args(argv)
+
+    paths = [os.path.join(args.reference_dir, f) for f in sorted(os.listdir(args.reference_dir))
+             if f.lower().endswith(IMAGE_EXTENSIONS)]
+    sample = load_sample(paths, args.limit)
+    if len(sample) < 2:
+        print("São necessárias pelo menos duas imagens")
+        return 1
+
+    backend = KerasBackend(build_vgg16(args.weights))
+    full = np.concatenate([backend.embed_batch(sample[i:i + 16])
+                           for i in range(0, len(sample), 16)])
+    report = drift_report(full, CompactEncoder(args.components, args.dtype))
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import os
+import sys
+import argparse
+import numpy as np
+import cv2
+
+BACKENDS = ("keras", "compiled", "tflite")
+TFLITE_QUANTIZATIONS = ("dynamic", "int8")
+INPUT_SHAPE = (224, 224, 3)
+# médias do ImageNet usadas pelo preprocess_input do VGG16 (modo caffe)
+VGG16_MEAN = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+
+# o TensorFlow só é importado quando um modelo é montado, então importar este
+# módulo (e a API) é rápido. weights_path: arquivo local com os pesos do VGG16 sem
+# o topo (o .h5 "notop" do Keras), carregado sem acesso à rede; sem ele, os pesos
+# do ImageNet vêm do cache do Keras (e são baixados se ainda não estiverem lá)
+def build_vgg16(weights_path=None):
+    from tensorflow.keras.applications import VGG16
+    from tensorflow.keras.models import Model
+
+    if weights_path:
+        if not os.path.exists(weights_path):
+            raise FileNotFoundError(f"Pesos do VGG16 não encontrados em {weights_path}")
+        base_model = VGG16(weights=None, include_top=False)
+        base_model.load_weights(weights_path)
+    else:
+        base_model = VGG16(weights='imagenet', include_top=False)
+    return Model(inputs=base_model.input, outputs=base_model.output)
+
+
+# mesmo cálculo do preprocess_input do VGG16: inverte a ordem dos canais e
+# subtrai a média do ImageNet
+def preprocess_image(img):
+    img = cv2.resize(img, (224, 224)).astype(np.float32)
+    return img[..., ::-1] - VGG16_MEAN
+
+
+# extrair características de uma imagem com qualquer backend
+def extract_features(img, backend):
+    batch = np.expand_dims(preprocess_image(img), axis=0)
+    return backend.embed_batch(batch)[0].flatten()
+
+
+# caminho original: model.predict do Keras
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, model):
+        self.model = model
+
+    def embed_batch(self, batch):
+        return self.model.predict(batch, verbose=0)  # Desativar saída verbosa
+
+
+# grafo compilado com assinatura fixa (tf.function + XLA); o lote é completado
+# até a próxima potência de 2, então só existem log2(max_batch) formas compiladas
+class CompiledBackend:
+    name = "compiled"
+
+    def __init__(self, model, max_batch=16, jit_compile=True):
+        import tensorflow as tf
+        self.max_batch = max_batch
+        self._fn = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32)],
+            jit_compile=jit_compile,
+            reduce_retracing=True)
+
+    def _padded_size(self, n):
+        size = 1
+        while size < n:
+            size *= 2
+        return size
+
+    def embed_batch(self, batch):
+        import tensorflow as tf
+        outputs = []
+        for start in range(0, len(batch), self.max_batch):
+            chunk = batch[start:start + self.max_batch]
+            n = len(chunk)
+            size = self._padded_size(n)
+            if size > n:
+                pad = np.zeros((size - n,) + INPUT_SHAPE, dtype=np.float32)
+                chunk = np.concatenate([chunk, pad])
+            outputs.append(self._fn(tf.constant(chunk, dtype=tf.float32)).numpy()[:n])
+        return np.concatenate(outputs)
+
+
+# modelo exportado para TFLite com quantização dinâmica (pesos int8) ou int8 completa
+class TFLiteBackend:
+    name = "tflite"
+
+    def __init__(self, model, quantization="dynamic", model_path=None,
+                 representative=None, num_threads=None):
+        import tensorflow as tf
+        self.quantization = quantization
+        if model_path and os.path.exists(model_path):
+            with open(model_path, "rb") as f:
+                content = f.read()
+        else:
+            content = convert_tflite(model, quantization, representative)
+            if model_path:
+                os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+                tmp_path = model_path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, model_path)
+
+        self._interpreter = tf.lite.Interpreter(
+            model_content=content, num_threads=num_threads or os.cpu_count())
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+
+    # a quantização int8 completa usa entrada/saída inteiras, com escala e ponto zero
+    def _quantize(self, batch):
+        scale, zero_point = self._input["quantization"]
+        if self._input["dtype"] == np.float32 or not scale:
+            return batch.astype(np.float32)
+        return np.clip(np.round(batch / scale + zero_point), -128, 127).astype(self._input["dtype"])
+
+    def _dequantize(self, output):
+        scale, zero_point = self._output["quantization"]
+        if self._output["dtype"] == np.float32 or not scale:
+            return output
+        return (output.astype(np.float32) - zero_point) * scale
+
+    # não é thread-safe: chamado apenas pela thread do MicroBatcher
+    def embed_batch(self, batch):
+        if self._batch_size != len(batch):
+            self._interpreter.resize_tensor_input(self._input["index"], (len(batch),) + INPUT_SHAPE)
+            self._interpreter.allocate_tensors()
+            self._batch_size = len(batch)
+        self._interpreter.set_tensor(self._input["index"], self._quantize(batch))
+        self._interpreter.invoke()
+        return self._dequantize(self._interpreter.get_tensor(self._output["index"]))
+
+
+def convert_tflite(model, quantization="dynamic", representative=None):
+    import tensorflow as tf
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "int8":
+        if representative is None or not len(representative):
+            raise ValueError("Quantização int8 precisa de imagens representativas")
+
+        def representative_dataset():
+            for tensor in representative:
+                yield [np.expand_dims(tensor, axis=0).astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+def load_backend(name, model, max_batch=16, quantization="dynamic",
+                 tflite_path=None, representative=None):
+    if name == "keras":
+        return KerasBackend(model)
+    if name == "compiled":
+        return CompiledBackend(model, max_batch=max_batch)
+    if name == "tflite":
+        return TFLiteBackend(model, quantization, tflite_path, representative)
+    raise ValueError(f"Backend desconhecido: {name} (opções: {', '.join(BACKENDS)})")
+
+
+# desvio do backend em relação ao Keras: cosseno entre os vetores das mesmas imagens
+def parity_check(backend, reference_backend, batch):
+    expected = reference_backend.embed_batch(batch).reshape(len(batch), -1)
+    actual = backend.embed_batch(batch).reshape(len(batch), -1)
+    cosines = np.sum(expected * actual, axis=1) / np.maximum(
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1), 1e-12)
+    return {
+        "backend": backend.name,
+        "images": len(batch),
+        "mean_cosine": float(np.mean(cosines)),
+        "min_cosine": float(np.min(cosines)),
+        "max_drift": float(np.max(1 - cosines)),
+    }
+
+
+def load_sample(paths, limit=16):
+    tensors = []
+    for path in paths[:limit]:
+        img = cv2.imread(path)
+        if img is not None:
+            tensors.append(preprocess_image(img))
+    return np.stack(tensors) if tensors else np.zeros((0,) + INPUT_SHAPE, dtype=np.float32)
+
+
+# python embedding.py --backend tflite --quantization int8 ./data/real/*.png
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara um backend de embedding com o Keras")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--backend", choices=BACKENDS, default="compiled")
+    parser.add_argument("--quantization", choices=TFLITE_QUANTIZATIONS, default="dynamic")
+    parser.add_argument("--limit", type=int, default=16)
+    parser.add_argument("--weights", default=os.environ.get("NOTIFICHECK_VGG16_WEIGHTS"),
+                        help="arquivo local com os pesos do VGG16 (sem o topo)")
+    args = parser.parse_args(argv)
+
+    sample = load_sample(args.images, args.limit)
+    if not len(sample):
+        print("Nenhuma imagem válida")
+        return 1
+    model = build_vgg16(args.weights)
+    backend = load_backend(args.backend, model, quantization=args.quantization,
+                           representative=sample)
+    report = parity_check(backend, KerasBackend(model), sample)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import io
+import numpy as np
+import cv2
+from PIL import Image
+
+# modos em que o Image.reduce funciona
+REDUCE_MODES = ("L", "LA", "RGB", "RGBA", "RGBa", "La", "CMYK", "I", "F")
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+# Converter uma imagem PIL para BGR (formato OpenCV)
+def to_bgr(image):
+    img_array = np.array(image)
+    if len(img_array.shape) == 3 and img_array.shape[2] == 3:
+        img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+    elif len(img_array.shape) == 2:
+        img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2BGR)
+    return img_array
+
+
+# Decodificar a imagem direto dos bytes recebidos, já na resolução usada pela
+# análise: o JPEG é decodificado em escala reduzida (draft) e o PNG é reduzido
+# por um fator inteiro, sem materializar a imagem em resolução cheia no pipeline
+def decode_upload(data, max_pixels=0, max_side=0):
+    try:
+        return _decode(data, max_pixels, max_side)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    except (Image.UnidentifiedImageError, OSError) as e:
+        # formato desconhecido ou arquivo truncado/corrompido
+        raise InvalidImage(f"Imagem inválida: {e}")
+
+
+def _decode(data, max_pixels, max_side):
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+
+    # o cabeçalho já informa o tamanho: recusar antes de decodificar os pixels
+    if max_pixels and width * height > max_pixels:
+        raise ImageTooLarge(
+            f"Imagem com {width}x{height} pixels excede o limite de {max_pixels}")
+
+    longest = max(width, height)
+    if max_side and longest > max_side:
+        if image.format == "JPEG":
+            image.draft(image.mode, (width * max_side // longest,
+                                     height * max_side // longest))
+        else:
+            factor = longest // max_side
+            if factor > 1:
+                # o reduce não aceita paleta, 1 bit ou 16 bits: converter antes
+                if image.mode not in REDUCE_MODES:
+                    image = image.convert("RGB")
+                image = image.reduce(factor)
+
+    # paleta, transparência etc. viram RGB (o VGG16 espera 3 canais)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    return to_bgr(image)
+
+
+# miniatura em escala de cinza na resolução canônica usada pelo SSIM
+def gray_thumbnail(img, size):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
@@ -0,0 +1,91 @@
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+class QueueFull(Exception):
+    pass
+
+
+# fila de análises assíncronas: POST devolve um id na hora e um número fixo de
+# workers consome a fila. Com a fila cheia, novos jobs são recusados (sem esperar).
+# Jobs concluídos ficam disponíveis por ttl segundos
+class JobQueue:
+    def __init__(self, max_queued=100, workers=4, ttl=600.0):
+        self.max_queued = max_queued
+        self.workers = workers
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+        self._queue = None
+        self._tasks = []
+        self._last_sweep = 0.0
+        self.rejected = 0
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # enfileirar fn(*args) (uma corrotina); devolve o job ou levanta QueueFull
+    def submit(self, fn, *args):
+        self._sweep()
+        if self._queue is None or self._queue.full():
+            self.rejected += 1
+            raise QueueFull()
+        job = {"job_id": uuid.uuid4().hex, "status": "queued", "created_at": time.time(),
+               "started_at": None, "finished_at": None, "result": None, "error": None}
+        self._queue.put_nowait((job, fn, args))
+        self._jobs[job["job_id"]] = job
+        return job
+
+    def get(self, job_id):
+        self._sweep()
+        return self._jobs.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job, fn, args = await self._queue.get()
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            try:
+                job["result"] = await fn(*args)
+                job["status"] = "done"
+            except asyncio.CancelledError:
+                job["status"] = "failed"
+                job["error"] = "Servidor encerrado antes da conclusão"
+                raise
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = getattr(e, "detail", None) or str(e)
+            finally:
+                job["finished_at"] = time.time()
+                self._queue.task_done()
+
+    # remover jobs concluídos há mais de ttl segundos (no máximo uma varredura por segundo)
+    def _sweep(self):
+        now = time.time()
+        if now - self._last_sweep < 1.0:
+            return
+        self._last_sweep = now
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["finished_at"] is not None and now - job["finished_at"] > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        counts = {status: 0 for status in JOB_STATUSES}
+        for job in list(self._jobs.values()):
+            counts[job["status"]] += 1
+        return {"workers": self.workers, "max_queued": self.max_queued, "ttl": self.ttl,
+                "queue_depth": self.queue_depth(), "rejected": self.rejected, **counts}
@@ -0,0 +1,32 @@
+# pesos da pontuação combinada
+SEMANTIC_WEIGHT = 0.7
+VISUAL_WEIGHT = 0.3
+
+
+# escolher a melhor correspondência entre os candidatos (em ordem decrescente de
+# cosseno): SSIM só neles e parada antecipada quando não há como melhorar
+def best_match(candidates, ssim_fn, certain_match=0.95):
+    best = {"index": None, "combined_score": 0,
+            "visual_similarity": 0, "semantic_similarity": 0}
+
+    for i, similarity_score in candidates:
+        similarity_score = float(similarity_score)
+
+        # limite superior da pontuação (SSIM <= 1): se não supera a melhor, as próximas também não
+        if SEMANTIC_WEIGHT * similarity_score + VISUAL_WEIGHT <= best["combined_score"]:
+            break
+
+        ssim_score = ssim_fn(i)
+        if ssim_score is None:
+            continue
+
+        combined_score = SEMANTIC_WEIGHT * similarity_score + VISUAL_WEIGHT * ssim_score
+        if combined_score > best["combined_score"]:
+            best = {"index": int(i), "combined_score": combined_score,
+                    "visual_similarity": ssim_score, "semantic_similarity": similarity_score}
+
+        # correspondência "certa": não vale a pena continuar
+        if best["combined_score"] >= certain_match:
+            break
+
+    return best
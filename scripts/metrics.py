@@ -0,0 +1,170 @@
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# limites (segundos) dos histogramas de duração
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# durações das etapas da requisição atual (para o cabeçalho Server-Timing)
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+# durações somadas das etapas da análise atual (observadas uma vez ao final)
+_analysis_timings = contextvars.ContextVar("analysis_timings", default=None)
+
+
+# histograma cumulativo no formato do Prometheus: só contadores, sem guardar amostras
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    # (limites com contagem acumulada, soma, total)
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            cumulative.append((bound, running))
+        return cumulative, total, running
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _bound(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+# registro das métricas da API: histogramas por etapa e por rota, requisições em
+# andamento e coletores que leem o estado dos outros componentes na hora da coleta
+class Metrics:
+    def __init__(self, prefix="notificheck", buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._stages = {}
+        self._requests = {}
+        self._responses = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def _histogram(self, table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = table.setdefault(key, Histogram(self.buckets))
+        return histogram
+
+    def observe(self, stage, seconds):
+        totals = _analysis_timings.get()
+        if totals is not None:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        else:
+            self._histogram(self._stages, stage).observe(seconds)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    # cronometrar uma etapa; funciona em volta de um await e dentro das threads do pool
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    # agrupar as etapas de uma análise: uma etapa que roda várias vezes (SSIM em
+    # blocos, consulta e gravação do cache) vira uma única observação com o total,
+    # então o _count de cada etapa conta análises. O dicionário é compartilhado com
+    # as threads do pool pela cópia do contexto
+    @contextmanager
+    def analysis(self):
+        totals = {}
+        token = _analysis_timings.set(totals)
+        try:
+            yield
+        finally:
+            _analysis_timings.reset(token)
+            for stage, seconds in totals.items():
+                self._histogram(self._stages, stage).observe(seconds)
+
+    def start_request(self):
+        with self._lock:
+            self.in_flight += 1
+        timings = {}
+        return timings, _request_timings.set(timings)
+
+    def end_request(self, token, route, status, seconds):
+        _request_timings.reset(token)
+        self._histogram(self._requests, route).observe(seconds)
+        with self._lock:
+            self.in_flight -= 1
+            key = (route, str(status))
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    # fn() devolve uma lista de (nome, tipo, descrição, [(rótulos, valor), ...])
+    def collector(self, fn):
+        self._collectors.append(fn)
+        return fn
+
+    def _render_histograms(self, lines, name, help_text, table, label):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, histogram in sorted(table.items()):
+            cumulative, total, count = histogram.snapshot()
+            for bound, running in cumulative:
+                lines.append(f"{name}_bucket{_labels({label: key, 'le': _bound(bound)})} {running}")
+            lines.append(f"{name}_sum{_labels({label: key})} {total}")
+            lines.append(f"{name}_count{_labels({label: key})} {count}")
+
+    # texto no formato de exposição do Prometheus (versão 0.0.4)
+    def render(self):
+        p = self.prefix
+        lines = []
+        self._render_histograms(lines, f"{p}_stage_seconds",
+                                "Duração de cada etapa da análise", self._stages, "stage")
+        self._render_histograms(lines, f"{p}_request_seconds",
+                                "Duração das requisições HTTP", self._requests, "route")
+        lines.append(f"# HELP {p}_responses_total Respostas HTTP por rota e status")
+        lines.append(f"# TYPE {p}_responses_total counter")
+        with self._lock:
+            responses = sorted(self._responses.items())
+            in_flight = self.in_flight
+        for (route, status), count in responses:
+            lines.append(f"{p}_responses_total{_labels({'route': route, 'status': status})} {count}")
+        lines.append(f"# HELP {p}_in_flight_requests Requisições em andamento")
+        lines.append(f"# TYPE {p}_in_flight_requests gauge")
+        lines.append(f"{p}_in_flight_requests {in_flight}")
+
+        for fn in self._collectors:
+            for name, kind, help_text, samples in fn():
+                lines.append(f"# HELP {p}_{name} {help_text}")
+                lines.append(f"# TYPE {p}_{name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{p}_{name}{_labels(labels)} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# cabeçalho Server-Timing: etapa;dur=<ms>, visível na aba de rede do navegador
+def server_timing(timings):
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
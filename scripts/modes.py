@@ -0,0 +1,59 @@
+import time
+import threading
+
+# do mais rápido ao mais completo:
+# fast = hash perceptual e VGG16 (sem SSIM), balanced = SSIM só nos candidatos
+# mais próximos, thorough = SSIM contra todas as referências, sem parada antecipada
+MODES = ("fast", "balanced", "thorough")
+
+
+# escolhe o modo de cada análise: o pedido pelo cliente, rebaixado um nível
+# (ou dois, com o dobro do limite) quando a fila ou a latência média passam dos
+# limites. Depois de rebaixar, espera `hold` segundos antes de voltar a subir,
+# para não alternar a cada requisição
+class ModeSelector:
+    def __init__(self, max_queue=0, max_latency=0.0, hold=10.0, smoothing=0.2):
+        self.max_queue = max_queue
+        self.max_latency = max_latency
+        self.hold = hold
+        self.smoothing = smoothing
+        # média móvel exponencial da duração das análises (s)
+        self.latency = 0.0
+        self.steps = 0
+        self._until = 0.0
+        self._lock = threading.Lock()
+        self.used = {mode: 0 for mode in MODES}
+        self.degraded = 0
+
+    def observe(self, seconds):
+        with self._lock:
+            self.latency += self.smoothing * (seconds - self.latency)
+
+    def _pressure(self, queue):
+        steps = 0
+        if self.max_queue and queue >= self.max_queue:
+            steps = 1 if queue < 2 * self.max_queue else 2
+        if self.max_latency and self.latency >= self.max_latency:
+            steps = max(steps, 1 if self.latency < 2 * self.max_latency else 2)
+        return steps
+
+    def choose(self, requested, queue):
+        now = time.monotonic()
+        with self._lock:
+            steps = self._pressure(queue)
+            if steps >= self.steps:
+                self.steps = steps
+                if steps:
+                    self._until = now + self.hold
+            elif now >= self._until:
+                self.steps = steps
+            mode = MODES[max(MODES.index(requested) - self.steps, 0)]
+            self.used[mode] += 1
+            if mode != requested:
+                self.degraded += 1
+        return mode
+
+    def stats(self):
+        return {"max_queue": self.max_queue, "max_latency_ms": self.max_latency * 1000,
+                "latency_ms": self.latency * 1000, "steps_down": self.steps,
+                "used": dict(self.used), "degraded": self.degraded}
@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+import cv2
+
+
+# dHash de size*size bits: compara pixels vizinhos de uma miniatura (size+1)xsize em
+# escala de cinza, resistente a recompressão e redimensionamento. Com 64 bits (8x8)
+# o hash capta pouco mais que o layout comum das notificações: serve só para achar
+# um candidato, que ainda precisa ser confirmado
+def dhash(img, size=8):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+# BK-tree: busca por distância de Hamming sem comparar com todos os hashes
+class BKTree:
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value, item):
+        self._size += 1
+        if self._root is None:
+            self._root = (value, item, {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, item, {})
+                return
+            node = child
+
+    # itens a no máximo max_distance, do mais próximo para o mais distante
+    def search(self, value, max_distance):
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[1]))
+            for d, child in node[2].items():
+                if distance - max_distance <= d <= distance + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda x: x[0])
+        return found
+
+
+# uploads já analisados, para reaproveitar o resultado de cópias quase idênticas
+class SeenUploads:
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+
+    def find(self, value, version, max_distance):
+        with self._lock:
+            for _, key in self._tree.search(value, max_distance):
+                entry = self._results.get(key)
+                if entry is not None and entry[0] == version:
+                    return entry[1]
+        return None
+
+    def add(self, value, version, result):
+        with self._lock:
+            key = (value, version)
+            if key not in self._results:
+                self._tree.add(value, key)
+            self._results[key] = (version, result)
+            self._results.move_to_end(key)
+            # BK-tree não remove nós: ao passar do limite, reconstruir só com os mais recentes
+            if len(self._results) > self.max_entries:
+                while len(self._results) > self.max_entries // 2:
+                    self._results.popitem(last=False)
+                self._tree = BKTree()
+                for k in self._results:
+                    self._tree.add(k[0], k)
+
+    def __len__(self):
+        return len(self._results)
@@ -0,0 +1,46 @@
+import os
+import json
+from collections import OrderedDict
+
+# nomes de coleção aparecem em URLs, métricas e nomes de arquivo
+VALID_NAME_CHARS = set("abcdefghijklmnopqrstuvwxyz0123456789_-.")
+
+
+class UnknownCollection(KeyError):
+    pass
+
+
+# coleções de referência configuradas no servidor: arquivo JSON com nome -> diretório
+# (ou nome -> {"dir": ..., "description": ...}). Sem arquivo, uma única coleção
+# "default" apontando para default_dir
+def load_collections(path=None, default_dir=None):
+    if not path:
+        return OrderedDict([("default", {"dir": default_dir, "description": ""})])
+
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    collections = OrderedDict()
+    for name, entry in raw.items():
+        if not name or set(name) - VALID_NAME_CHARS:
+            raise ValueError(f"Nome de coleção inválido: {name!r}")
+        if isinstance(entry, str):
+            entry = {"dir": entry}
+        # caminhos relativos são relativos ao arquivo de configuração
+        directory = os.path.join(base, os.path.expanduser(entry["dir"]))
+        collections[name] = {"dir": os.path.normpath(directory),
+                             "description": entry.get("description", "")}
+    if not collections:
+        raise ValueError(f"Nenhuma coleção definida em {path}")
+    return collections
+
+
+# "banco_x,apostas" -> ["banco_x", "apostas"]; vazio = coleções padrão
+def parse_selection(value, collections, defaults=None):
+    names = [name.strip() for name in (value or "").split(",") if name.strip()]
+    if not names:
+        names = list(defaults or collections)
+    unknown = [name for name in names if name not in collections]
+    if unknown:
+        raise UnknownCollection(", ".join(unknown))
+    return list(OrderedDict.fromkeys(names))
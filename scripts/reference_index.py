@@ -0,0 +1,346 @@
+import os
+import time
+import hashlib
+import threading
+import numpy as np
+import cv2
+from phash import dhash, BKTree
+from compact import EncodedMatrix, CompactEncoder, SCORE_BLOCK
+from ann import IVFIndex
+from imaging import gray_thumbnail
+from snapshot_store import BuildLock, read_current, write_snapshot, load_snapshot
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def normalize_rows(features):
+    features = np.asarray(features, dtype=np.float32)
+    if features.size == 0:
+        return features
+    norms = np.linalg.norm(features, axis=-1, keepdims=True)
+    return features / np.maximum(norms, 1e-12)
+
+
+# índices das k maiores pontuações, em ordem decrescente (k <= 0 devolve todas)
+def shortlist(scores, k):
+    n = len(scores)
+    if k <= 0 or k >= n:
+        order = np.argsort(-scores)
+    else:
+        top = np.argpartition(-scores, k - 1)[:k]
+        order = top[np.argsort(-scores[top])]
+    return order
+
+
+# estado imutável do índice: os requests sempre leem um snapshot completo
+class ReferenceSnapshot:
+    def __init__(self, names, features, version, hashes=(), encoder=None, ann=None,
+                 thumbnails=None):
+        # representação compacta opcional: PCA ajustada nas próprias referências
+        encoder = encoder.fit(features) if encoder is not None else None
+        # matriz normalizada: a similaridade de cosseno vira um produto matriz-vetor
+        matrix = encoder.encode(features) if encoder is not None else EncodedMatrix.encode(features)
+        self._init(names, matrix, version, hashes, encoder, ann, thumbnails)
+
+    # snapshot a partir de dados já codificados (por exemplo, mapeados de um arquivo);
+    # built_ann: IVF já montado para estes dados, também mapeado do snapshot
+    @classmethod
+    def from_encoded(cls, names, matrix, version, hashes=(), encoder=None, ann=None,
+                     thumbnails=None, refreshed_at=None, built_ann=None):
+        snapshot = cls.__new__(cls)
+        snapshot._init(names, matrix, version, hashes, encoder, ann, thumbnails, built_ann)
+        if refreshed_at is not None:
+            snapshot.refreshed_at = refreshed_at
+        return snapshot
+
+    def _init(self, names, matrix, version, hashes, encoder, ann, thumbnails, built_ann=None):
+        self.names = names
+        self.matrix = matrix
+        self.encoder = encoder
+        # referências em escala de cinza na resolução canônica do SSIM (n, altura, largura)
+        self.thumbnails = thumbnails
+        # dHash de cada referência, pesquisável por distância de Hamming
+        self.hash_tree = BKTree()
+        for i, value in enumerate(hashes):
+            self.hash_tree.add(int(value), i)
+        self.version = version
+        self.refreshed_at = time.time()
+        if built_ann is not None:
+            self.ann = built_ann
+        else:
+            self.ann = self._build_ann(ann) if ann is not None and len(self) else None
+
+    # índice aproximado (IVF); reaproveita os centróides do anterior quando o espaço
+    # dos vetores é o mesmo e o conjunto não cresceu demais desde o treino. Os vetores
+    # são lidos da matriz em blocos: o IVF guarda só os ids de cada lista
+    def _build_ann(self, previous):
+        n = len(self.matrix)
+        dims = self.matrix.data.shape[1]
+        same_space = self.encoder is None or self.encoder.projection is None
+        if (previous.is_trained and same_space
+                and previous.centroids.shape[1] == dims
+                and n <= 2 * previous.trained_size):
+            ann = previous.empty_copy()
+        else:
+            ann = IVFIndex(previous.nlist, previous.nprobe, previous.iterations, previous.seed)
+            ann.train(self.matrix.take(ann.sample_rows(n)))
+        for start in range(0, n, SCORE_BLOCK):
+            stop = min(start + SCORE_BLOCK, n)
+            ann.add(self.matrix.rows(start, stop), np.arange(start, stop))
+        return ann
+
+    def __len__(self):
+        return len(self.names)
+
+    def query_vector(self, features):
+        query = np.asarray(features, dtype=np.float32)
+        if self.encoder is not None:
+            query = self.encoder.transform(query[None])[0]
+        return normalize_rows(query)
+
+    # cosseno da consulta contra uma única referência
+    def score(self, features, i):
+        return float(self.matrix.rows(i, i + 1)[0] @ self.query_vector(features))
+
+    # similaridade de cosseno da consulta contra todas as referências de uma vez
+    def scores(self, features):
+        if not len(self):
+            return np.zeros(0, dtype=np.float32)
+        return self.matrix.dot(self.query_vector(features))
+
+    # as k referências mais próximas: lista de (índice, cosseno) em ordem decrescente;
+    # com o índice aproximado ativo, só as listas IVF mais próximas são percorridas
+    def search(self, features, k):
+        if self.ann is not None and k > 0:
+            ids, scores = self.ann.search(self.query_vector(features), k, self.matrix)
+            return list(zip(ids.tolist(), scores.tolist()))
+        scores = self.scores(features)
+        return [(int(i), float(scores[i])) for i in shortlist(scores, k)]
+
+
+# índice de características das imagens de referência, persistido em disco
+# e atualizado de forma incremental (só reprocessa arquivos novos ou alterados).
+# Com shared=True, o snapshot é gravado em arquivos mapeados em memória: um único
+# processo (quem obtém o lock) monta o índice e os demais workers só mapeiam
+class ReferenceIndex:
+    def __init__(self, reference_dir, embed_fn, cache_dir="index_cache", encoder=None,
+                 cache_tag="full", ann_params=None, thumbnail_size=(216, 480), shared=False):
+        self.reference_dir = reference_dir
+        self.shared = shared
+        self.thumbnail_size = thumbnail_size
+        self.embed_fn = embed_fn
+        self.encoder = encoder
+        # parâmetros do índice aproximado: nlist, nprobe e min_size (referências mínimas)
+        self.ann_params = ann_params
+        self.cache_dir = cache_dir
+        # o tag separa os caches de modos de embedding diferentes (vetor completo ou com pooling)
+        self.cache_path = os.path.join(
+            cache_dir,
+            hashlib.sha1(os.path.abspath(reference_dir).encode()).hexdigest()[:16]
+            + f"-{cache_tag}-{thumbnail_size[0]}x{thumbnail_size[1]}.npz")
+        self.ann_path = self.cache_path[:-len(".npz")] + ".ivf.npz"
+        self.snapshot_root = self.cache_path[:-len(".npz")] + ".snapshots"
+        self._ann = None
+        self._entries = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._snapshot = ReferenceSnapshot([], np.zeros((0, 0), dtype=np.float32), "")
+        self.watched = False
+        self._load_ann()
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    # centróides do IVF treinados anteriormente, se existirem
+    def _load_ann(self):
+        if self.ann_params and os.path.exists(self.ann_path):
+            try:
+                self._ann = IVFIndex.load(self.ann_path)
+                self._ann.nprobe = self.ann_params["nprobe"]
+            except Exception as e:
+                print(f"Índice aproximado em {self.ann_path} ignorado: {e}")
+
+    # carregar o índice salvo anteriormente, se existir
+    def _load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            data = np.load(self.cache_path, allow_pickle=False)
+            for name, size, mtime, features, value, thumbnail in zip(
+                    data["names"], data["sizes"], data["mtimes"], data["features"],
+                    data["hashes"], data["thumbnails"]):
+                self._entries[str(name)] = (
+                    int(size), float(mtime), features, int(value), thumbnail)
+        except Exception as e:
+            print(f"Índice em {self.cache_path} ignorado: {e}")
+            self._entries = {}
+
+    def _save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        names = sorted(self._entries)
+        features = [self._entries[n][2] for n in names]
+        # gravar em arquivo temporário e renomear para não deixar índice corrompido
+        tmp_path = self.cache_path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            names=np.array(names, dtype=str),
+            sizes=np.array([self._entries[n][0] for n in names], dtype=np.int64),
+            mtimes=np.array([self._entries[n][1] for n in names], dtype=np.float64),
+            features=np.stack(features) if features else np.zeros((0, 0), dtype=np.float32),
+            hashes=np.array([self._entries[n][3] for n in names], dtype=np.uint64),
+            thumbnails=self._stack_thumbnails(names),
+        )
+        os.replace(tmp_path, self.cache_path)
+
+    def _stack_thumbnails(self, names):
+        width, height = self.thumbnail_size
+        if not names:
+            return np.zeros((0, height, width), dtype=np.uint8)
+        return np.stack([self._entries[n][4] for n in names])
+
+    def _scan(self):
+        files = {}
+        for f in os.listdir(self.reference_dir):
+            if not f.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            try:
+                st = os.stat(os.path.join(self.reference_dir, f))
+            except OSError:
+                # removido entre o listdir e o stat
+                continue
+            files[f] = (st.st_size, st.st_mtime)
+        return files
+
+    # sincronizar o índice com o diretório; retorna True se algo mudou.
+    # O novo estado é montado à parte e publicado de uma vez (troca atômica do
+    # snapshot), então requisições em andamento nunca veem um conjunto pela metade
+    def refresh(self):
+        with self._lock:
+            if not self.shared:
+                changed = self._sync_entries()
+                if changed or not self._snapshot.version:
+                    self._publish()
+                return changed
+            return self._refresh_shared()
+
+    # atualizar as entradas em memória a partir do diretório (só quem monta o índice)
+    def _sync_entries(self):
+        if not self._loaded:
+            self._load()
+            self._loaded = True
+
+        files = self._scan()
+        changed = False
+
+        for name in list(self._entries):
+            if name not in files:
+                del self._entries[name]
+                changed = True
+
+        for name, (size, mtime) in files.items():
+            entry = self._entries.get(name)
+            if entry is not None and entry[0] == size and entry[1] == mtime:
+                continue
+            ref_img = cv2.imread(os.path.join(self.reference_dir, name))
+            if ref_img is None:
+                if self._entries.pop(name, None) is not None:
+                    changed = True
+                continue
+            self._entries[name] = (size, mtime, self.embed_fn(ref_img), dhash(ref_img),
+                                   gray_thumbnail(ref_img, self.thumbnail_size))
+            changed = True
+
+        if changed:
+            self._save()
+        return changed
+
+    # modo compartilhado: só mapear a versão atual, sem nunca montar o índice
+    # (para processos que apenas consultam, como os workers do scan_check.py)
+    def attach(self):
+        with self._lock:
+            return self._map_current()
+
+    def _refresh_shared(self):
+        lock = BuildLock(self.snapshot_root)
+        os.makedirs(self.snapshot_root, exist_ok=True)
+        # sem nenhum snapshot ainda, esperar quem está montando em vez de responder vazio
+        wait = 600.0 if not self._snapshot.version and not read_current(self.snapshot_root) else 0.0
+        builder = lock.acquire(timeout=wait)
+        if builder:
+            try:
+                self._sync_entries()
+                version = self._entries_version()
+                if read_current(self.snapshot_root) != f"v-{version}":
+                    built = self._build_snapshot(with_ann=True)
+                    write_snapshot(self.snapshot_root, built.version, built.names, built.matrix,
+                                   [self._entries[n][3] for n in built.names],
+                                   built.thumbnails, built.encoder, built.ann)
+            finally:
+                lock.release()
+        return self._map_current(save_ann=builder)
+
+    # mapear a versão apontada por CURRENT, se for diferente da que já está em uso;
+    # o BK-tree é reconstruído em cada processo, o IVF vem mapeado do snapshot
+    def _map_current(self, save_ann=False):
+        current = read_current(self.snapshot_root)
+        if current is None or current == f"v-{self._snapshot.version}":
+            return False
+        data = load_snapshot(self.snapshot_root, current)
+        meta = data["meta"]
+        encoder = None
+        if meta["encoder"] is not None:
+            encoder = CompactEncoder(meta["encoder"]["components"], meta["encoder"]["dtype"])
+            encoder.projection = data["projection"]
+            encoder.explained_variance = meta["encoder"]["explained_variance"]
+        names = meta["names"]
+        template = self._ann_template(len(names))
+        built_ann = None
+        if template is not None and data["ivf_params"] is not None:
+            built_ann = IVFIndex.from_arrays(data["ivf_params"], data["ivf_centroids"],
+                                             data["ivf_offsets"], data["ivf_ids"])
+            built_ann.nprobe = template.nprobe
+        self._snapshot = ReferenceSnapshot.from_encoded(
+            names, EncodedMatrix(data["vectors"], data["scales"]), meta["version"],
+            data["hashes"], encoder, template, data["thumbnails"],
+            refreshed_at=meta["built_at"], built_ann=built_ann)
+        self._keep_ann(save=save_ann)
+        return True
+
+    def _entries_version(self):
+        digest = hashlib.sha1()
+        for n in sorted(self._entries):
+            digest.update(f"{n}:{self._entries[n][0]}:{self._entries[n][1]};".encode())
+        return digest.hexdigest()[:12]
+
+    def _ann_template(self, size):
+        if self.ann_params and size >= self.ann_params["min_size"]:
+            return self._ann or IVFIndex(self.ann_params["nlist"], self.ann_params["nprobe"])
+        return None
+
+    def _build_snapshot(self, with_ann=False):
+        names = sorted(self._entries)
+        features = (np.stack([self._entries[n][2] for n in names]).astype(np.float32)
+                    if names else np.zeros((0, 0), dtype=np.float32))
+        return ReferenceSnapshot(
+            names, features, self._entries_version(), [self._entries[n][3] for n in names],
+            self.encoder, self._ann_template(len(names)) if with_ann else None,
+            self._stack_thumbnails(names))
+
+    def _publish(self):
+        self._snapshot = self._build_snapshot(with_ann=True)
+        self._keep_ann()
+
+    # guardar o IVF (e salvar em disco quando foi treinado de novo) para a próxima versão;
+    # no modo compartilhado só o processo que monta o snapshot grava o arquivo
+    def _keep_ann(self, save=True):
+        if self._snapshot.ann is not None:
+            previous = getattr(self._ann, "centroids", None)
+            centroids = self._snapshot.ann.centroids
+            # no modo compartilhado os centróides vêm mapeados (outro objeto, mesmos valores)
+            trained_now = previous is None or (
+                centroids is not previous and not np.array_equal(centroids, previous))
+            self._ann = self._snapshot.ann
+            if trained_now and save:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._ann.save(self.ann_path)
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# intervalo mínimo (s) entre varreduras do cache em disco
+PRUNE_INTERVAL = 60.0
+
+
+# chave de cache: hash dos pixels decodificados + versão das referências + parâmetros
+def content_key(img_array, *parts):
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(str(img_array.shape).encode())
+    digest.update(img_array.tobytes())
+    for part in parts:
+        digest.update(f"|{part}".encode())
+    return digest.hexdigest()
+
+
+# cache de resultados em memória (LRU + TTL), opcionalmente persistido em disco
+class ResultCache:
+    def __init__(self, max_entries=10000, ttl=3600.0, disk_dir=None, max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self._pruning = False
+        self.hits = 0
+        self.misses = 0
+        self.disk_removed = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self._entries[key]
+
+        result = self._read_disk(key, now)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._store(key, result, now)
+        return result
+
+    def put(self, key, result):
+        now = time.time()
+        with self._lock:
+            self._store(key, result, now)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"stored_at": now, "result": result}, f)
+            os.replace(tmp_path, path)
+            self._maybe_prune(now)
+
+    def _store(self, key, result, stored_at):
+        self._entries[key] = (stored_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - entry["stored_at"] > self.ttl:
+            self._remove(path)
+            return None
+        return entry["result"]
+
+    # entradas de versões antigas das referências nunca são lidas de novo: a limpeza
+    # não pode depender da leitura. Roda no máximo a cada PRUNE_INTERVAL, dentro do put
+    def _maybe_prune(self, now):
+        with self._lock:
+            if self._pruning or now - self._last_prune < PRUNE_INTERVAL:
+                return
+            self._pruning = True
+            self._last_prune = now
+        try:
+            self.prune_disk(now)
+        finally:
+            self._pruning = False
+
+    # remover do disco as entradas vencidas (pela data do arquivo, a mesma do put) e,
+    # acima de max_disk_entries, as mais antigas
+    def prune_disk(self, now=None):
+        now = now or time.time()
+        kept = []
+        removed = 0
+        for bucket in os.scandir(self.disk_dir):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                try:
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+                if now - mtime > self.ttl:
+                    removed += self._remove(entry.path)
+                elif entry.name.endswith(".json"):
+                    kept.append((mtime, entry.path))
+        if self.max_disk_entries and len(kept) > self.max_disk_entries:
+            kept.sort()
+            for _, path in kept[:len(kept) - self.max_disk_entries]:
+                removed += self._remove(path)
+        with self._lock:
+            self.disk_removed += removed
+        return removed
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "disk": bool(self.disk_dir),
+            "max_disk_entries": self.max_disk_entries,
+            "disk_removed": self.disk_removed,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,302 @@
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from reference_collections import load_collections, parse_selection, UnknownCollection
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+OUTPUT_FORMATS = ("parquet", "csv")
+SCHEMA = pa.schema([
+    ("file", pa.string()),
+    ("is_authentic", pa.bool_()),
+    ("confidence", pa.float64()),
+    ("combined_score", pa.float64()),
+    ("visual_similarity", pa.float64()),
+    ("semantic_similarity", pa.float64()),
+    ("best_match_file", pa.string()),
+    ("collection", pa.string()),
+    ("reference_version", pa.string()),
+    ("error", pa.string()),
+    ("scored_at", pa.float64()),
+])
+
+# estado de cada processo do pool (modelo, índices das coleções e módulo da API)
+_worker = {}
+
+
+# montar (ou atualizar) os índices compartilhados das coleções; roda em um processo
+# separado para o processo principal não carregar o TensorFlow
+def build_index(names, backend_name):
+    import api_check
+    from embedding import build_vgg16, load_backend, preprocess_image
+
+    backend = load_backend(backend_name, build_vgg16(api_check.VGG16_WEIGHTS),
+                           quantization=api_check.TFLITE_QUANTIZATION,
+                           tflite_path=api_check.TFLITE_PATH)
+    predict = api_check.batch_predictor(backend)
+    for name in names:
+        index = api_check.new_reference_index(
+            api_check.configured_collections[name]["dir"],
+            lambda img: predict(np.expand_dims(preprocess_image(img), 0))[0].flatten(),
+            shared=True)
+        index.refresh()
+        print(f"Coleção {name}: {len(index.snapshot)} imagens "
+              f"(versão {index.snapshot.version})")
+
+
+def init_worker(names, backend_name, threads, mode):
+    import tensorflow as tf
+    if threads:
+        # sem isso cada processo tentaria usar todos os núcleos
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    import api_check
+    from embedding import build_vgg16, load_backend
+
+    backend = load_backend(backend_name, build_vgg16(api_check.VGG16_WEIGHTS),
+                           quantization=api_check.TFLITE_QUANTIZATION,
+                           tflite_path=api_check.TFLITE_PATH)
+    # os workers só mapeiam os snapshots já montados (memória compartilhada entre eles)
+    selection = {}
+    for name in names:
+        index = api_check.new_reference_index(
+            api_check.configured_collections[name]["dir"], None, shared=True)
+        index.attach()
+        selection[name] = index.snapshot
+    _worker.update(api=api_check, predict=api_check.batch_predictor(backend),
+                   selection=selection, version=api_check.selection_version(selection), mode=mode)
+
+
+def _error_row(path, error, version):
+    return {"file": path, "error": str(error), "reference_version": version,
+            "scored_at": time.time()}
+
+
+# pontuar um grupo de arquivos: decodificação como na API, um único forward pass
+# do VGG16 para o grupo e a mesma busca/combinação 0.7/0.3 e limiar 0.65 do /analyze
+def score_chunk(paths):
+    from embedding import preprocess_image
+    api = _worker["api"]
+    selection = _worker["selection"]
+    version = _worker["version"]
+    rows, images, tensors = [], [], []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                img_array = api.decode_image(f.read())
+            tensors.append(preprocess_image(img_array))
+            images.append((path, img_array))
+        except Exception as e:
+            rows.append(_error_row(path, e, version))
+
+    if tensors:
+        outputs = _worker["predict"](np.stack(tensors))
+        for (path, img_array), output in zip(images, outputs):
+            try:
+                match = api.score_upload(img_array, output.flatten(), selection, _worker["mode"])
+                result = api.build_result(match, selection)
+                rows.append(dict(result, file=path, error=None,
+                                 reference_version=version, scored_at=time.time()))
+            except Exception as e:
+                rows.append(_error_row(path, e, version))
+    return rows
+
+
+def iter_images(inputs):
+    for source in inputs:
+        if os.path.isfile(source):
+            # arquivo de texto com um caminho por linha
+            with open(source, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.abspath(line)
+            continue
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.abspath(os.path.join(root, name))
+
+
+def _parts(out_dir):
+    if not os.path.isdir(out_dir):
+        return []
+    return sorted(os.path.join(out_dir, f) for f in os.listdir(out_dir)
+                  if f.startswith("part-") and f.endswith(OUTPUT_FORMATS))
+
+
+# arquivos já pontuados em execuções anteriores (lidos só das colunas necessárias)
+def scored_files(out_dir, retry_errors=False):
+    done = set()
+    for path in _parts(out_dir):
+        if path.endswith(".parquet"):
+            table = pq.read_table(path, columns=["file", "error"])
+        else:
+            table = pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(
+                include_columns=["file", "error"],
+                column_types={"file": pa.string(), "error": pa.string()}))
+        files = table.column("file").to_pylist()
+        errors = table.column("error").to_pylist()
+        done.update(f for f, e in zip(files, errors) if not (retry_errors and e))
+    return done
+
+
+# grava os resultados em partes numeradas; cada parte é escrita em um arquivo
+# temporário e renomeada, então uma interrupção nunca deixa uma parte corrompida
+class PartWriter:
+    def __init__(self, out_dir, fmt="parquet", rows_per_part=50000, flush_interval=60.0):
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.rows_per_part = rows_per_part
+        self.flush_interval = flush_interval
+        os.makedirs(out_dir, exist_ok=True)
+        self._next = len(_parts(out_dir))
+        self._rows = []
+        self._last_flush = time.monotonic()
+        self.written = 0
+
+    def add(self, rows):
+        self._rows.extend(rows)
+        if (len(self._rows) >= self.rows_per_part
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._rows:
+            return
+        table = pa.Table.from_pylist(self._rows, schema=SCHEMA)
+        path = os.path.join(self.out_dir, f"part-{self._next:05d}.{self.fmt}")
+        tmp_path = path + ".tmp"
+        if self.fmt == "parquet":
+            pq.write_table(table, tmp_path)
+        else:
+            pa_csv.write_csv(table, tmp_path)
+        os.replace(tmp_path, path)
+        self._next += 1
+        self.written += len(self._rows)
+        self._rows = []
+
+
+def _chunks(paths, size):
+    chunk = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# python scan_check.py /arquivo/capturas --collections banco_x,apostas --out resultados --workers 4
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Pontua em lote arquivos de capturas, sem passar pela API HTTP")
+    parser.add_argument("inputs", nargs="+",
+                        help="pastas com imagens ou arquivos de texto com um caminho por linha")
+    parser.add_argument("--collections", default=os.environ.get(
+        "NOTIFICHECK_DEFAULT_COLLECTIONS", ""),
+        help="coleções de referência (NOTIFICHECK_COLLECTIONS), separadas por vírgula")
+    parser.add_argument("--out", default="scan_results", help="diretório das partes de saída")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="parquet")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--batch-size", type=int, default=16,
+                        help="imagens por forward pass em cada worker")
+    parser.add_argument("--mode", choices=("fast", "balanced", "thorough"), default="balanced",
+                        help="fast = sem SSIM, thorough = SSIM contra todas as referências")
+    parser.add_argument("--backend", default=os.environ.get("NOTIFICHECK_BACKEND", "keras"))
+    parser.add_argument("--rows-per-part", type=int, default=50000)
+    parser.add_argument("--retry-errors", action="store_true",
+                        help="pontuar de novo os arquivos que falharam antes")
+    args = parser.parse_args(argv)
+
+    # mesma configuração de coleções da API (os workers a leem do ambiente)
+    collections = load_collections(os.environ.get("NOTIFICHECK_COLLECTIONS"), os.environ.get(
+        "NOTIFICHECK_REFERENCE_DIR", r"C:\proj_notific_fake\data\real"))
+    try:
+        names = parse_selection(args.collections, collections)
+    except UnknownCollection as e:
+        print(f"Coleção desconhecida: {e.args[0]}")
+        return 1
+    missing = [name for name in names if not os.path.isdir(collections[name]["dir"])]
+    if missing:
+        print(f"Diretório não encontrado para as coleções: {', '.join(missing)}")
+        return 1
+
+    done = scored_files(args.out, args.retry_errors)
+    if done:
+        print(f"Retomando: {len(done)} arquivos já pontuados serão ignorados")
+
+    # spawn: o TensorFlow não funciona depois de um fork
+    context = multiprocessing.get_context("spawn")
+    builder = context.Process(target=build_index, args=(names, args.backend))
+    builder.start()
+    builder.join()
+    if builder.exitcode != 0:
+        print("Falha ao montar o índice de referência")
+        return 1
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    writer = PartWriter(args.out, args.format, args.rows_per_part)
+    todo = (path for path in iter_images(args.inputs) if path not in done)
+    start = time.monotonic()
+    scored = 0
+    pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                               initializer=init_worker,
+                               initargs=(names, args.backend, threads, args.mode))
+    interrupted = False
+    try:
+        pending = set()
+
+        # grava os grupos que terminaram bem antes de propagar a falha de outro
+        def collect(futures):
+            nonlocal scored
+            error = None
+            for future in futures:
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                writer.add(rows)
+                scored += len(rows)
+            elapsed = time.monotonic() - start
+            print(f"{scored} imagens pontuadas ({scored / max(elapsed, 1e-9):.1f}/s)")
+            if error is not None:
+                raise error
+
+        # no máximo dois grupos por worker em andamento (a lista de arquivos não vai toda para a memória)
+        for chunk in _chunks(todo, args.batch_size):
+            pending.add(pool.submit(score_chunk, chunk))
+            if len(pending) >= args.workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        finished, _ = wait(pending)
+        collect(finished)
+    except KeyboardInterrupt:
+        print("Interrompido; salvando o que já foi pontuado")
+        interrupted = True
+        return 130
+    except BaseException:
+        # worker morto (BrokenProcessPool), falha de escrita...: o que já foi
+        # pontuado é salvo antes de propagar o erro; a próxima execução retoma dali
+        print("Falha; salvando o que já foi pontuado")
+        interrupted = True
+        raise
+    finally:
+        pool.shutdown(wait=not interrupted, cancel_futures=interrupted)
+        writer.flush()
+    print(f"{writer.written} resultados gravados em {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import shutil
+import numpy as np
+
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "build.lock"
+# quantas versões anteriores manter no disco (workers podem ainda estar mapeando)
+KEEP_VERSIONS = 2
+
+
+# lock entre processos baseado em arquivo criado com O_EXCL (funciona no Linux e no
+# Windows); um lock mais velho que stale_after é considerado abandonado
+class BuildLock:
+    def __init__(self, root, stale_after=3600.0):
+        self.path = os.path.join(root, LOCK_FILE)
+        self.stale_after = stale_after
+        self.held = False
+
+    def acquire(self, timeout=0.0, poll=0.2):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                with os.fdopen(fd, "w") as f:
+                    f.write(f"{os.getpid()} {time.time()}")
+                self.held = True
+                return True
+            except FileExistsError:
+                self._break_if_stale()
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+
+    def _break_if_stale(self):
+        try:
+            if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                os.remove(self.path)
+        except OSError:
+            pass
+
+    def release(self):
+        if self.held:
+            self.held = False
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def read_current(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+# gravar o snapshot em um diretório novo e só então apontar CURRENT para ele
+# (escrita seguida de rename, então nenhum worker enxerga um snapshot incompleto)
+def write_snapshot(root, version, names, matrix, hashes, thumbnails, encoder=None, ann=None):
+    os.makedirs(root, exist_ok=True)
+    name = f"v-{version}"
+    final_dir = os.path.join(root, name)
+    if not os.path.exists(final_dir):
+        tmp_dir = os.path.join(root, f".{name}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        # .npy guarda os dados alinhados após o cabeçalho, prontos para np.load(mmap_mode="r")
+        np.save(os.path.join(tmp_dir, "vectors.npy"), np.ascontiguousarray(matrix.data))
+        if matrix.scales is not None:
+            np.save(os.path.join(tmp_dir, "scales.npy"), matrix.scales)
+        np.save(os.path.join(tmp_dir, "thumbnails.npy"), np.ascontiguousarray(thumbnails))
+        np.save(os.path.join(tmp_dir, "hashes.npy"), np.array(hashes, dtype=np.uint64))
+        meta = {"version": version, "names": list(names), "built_at": time.time(),
+                "encoder": None}
+        if encoder is not None:
+            meta["encoder"] = {"components": encoder.components, "dtype": encoder.dtype,
+                               "explained_variance": encoder.explained_variance}
+            if encoder.projection is not None:
+                np.save(os.path.join(tmp_dir, "projection.npy"), encoder.projection)
+        # IVF: centróides e ids das listas também mapeados, sem k-means em cada worker
+        if ann is not None:
+            np.save(os.path.join(tmp_dir, "ivf_params.npy"), ann.params)
+            np.save(os.path.join(tmp_dir, "ivf_centroids.npy"), ann.centroids)
+            np.save(os.path.join(tmp_dir, "ivf_offsets.npy"), ann.offsets)
+            np.save(os.path.join(tmp_dir, "ivf_ids.npy"), ann.ids)
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        os.rename(tmp_dir, final_dir)
+
+    tmp_current = os.path.join(root, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp_current, "w") as f:
+        f.write(name)
+    os.replace(tmp_current, os.path.join(root, CURRENT_FILE))
+    _remove_old_versions(root, name)
+    return name
+
+
+def _remove_old_versions(root, current):
+    versions = sorted(
+        (d for d in os.listdir(root) if d.startswith("v-") and d != current),
+        key=lambda d: os.path.getmtime(os.path.join(root, d)), reverse=True)
+    for old in versions[KEEP_VERSIONS - 1:]:
+        # no Windows a remoção falha enquanto algum worker mantiver o mapeamento
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+
+
+# abrir o snapshot atual sem cópia: os arrays são mapeados do arquivo, e todos os
+# workers que mapeiam a mesma versão compartilham as mesmas páginas de memória
+def load_snapshot(root, name):
+    directory = os.path.join(root, name)
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+
+    def mapped(filename):
+        path = os.path.join(directory, filename)
+        return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+    return {
+        "meta": meta,
+        "vectors": mapped("vectors.npy"),
+        "scales": mapped("scales.npy"),
+        "thumbnails": mapped("thumbnails.npy"),
+        "hashes": mapped("hashes.npy"),
+        "projection": mapped("projection.npy"),
+        "ivf_params": mapped("ivf_params.npy"),
+        "ivf_centroids": mapped("ivf_centroids.npy"),
+        "ivf_offsets": mapped("ivf_offsets.npy"),
+        "ivf_ids": mapped("ivf_ids.npy"),
+    }
@@ -0,0 +1,69 @@
+import numpy as np
+import cv2
+
+# mesmos parâmetros do structural_similarity do skimage (o que a API usava):
+# janela uniforme 7x7, K1/K2 padrão, covariância amostral e faixa de 255 (uint8)
+WIN_SIZE = 7
+K1 = 0.01
+K2 = 0.03
+DATA_RANGE = 255.0
+# os pixels são centralizados antes das contas em float32: com valores menores,
+# E[x²] - E[x]² perde bem menos precisão
+OFFSET = 128.0
+
+
+# média em janelas win x win, devolvendo só as posições em que a janela cabe
+# inteira (a mesma região que o skimage usa na média). O lote (k, H, W) é filtrado
+# como uma única imagem (k*H, W): as linhas em que uma janela pega duas imagens
+# vizinhas ficam na borda descartada
+def _box_mean(x, win):
+    pad = (win - 1) // 2
+    shape = x.shape
+    filtered = cv2.blur(x.reshape(-1, shape[-1]), (win, win)).reshape(shape)
+    return filtered[..., pad:shape[-2] - pad, pad:shape[-1] - pad]
+
+
+# estatísticas locais da imagem enviada, calculadas uma vez por requisição
+class UploadStats:
+    def __init__(self, gray, win=WIN_SIZE, data_range=DATA_RANGE):
+        self.win = win
+        self.data_range = data_range
+        cov_norm = np.float32(win * win / (win * win - 1))
+        x = gray.astype(np.float32) - np.float32(OFFSET)
+        self.x = x
+        self.mu = _box_mean(x, win)
+        mean = self.mu + np.float32(OFFSET)
+        self.luminance = 2 * mean
+        self.luminance_den = mean * mean + np.float32((K1 * data_range) ** 2)
+        self.var_c2 = (cov_norm * (_box_mean(x * x, win) - self.mu * self.mu)
+                       + np.float32((K2 * data_range) ** 2))
+
+
+# SSIM da imagem enviada contra um lote de referências (k, H, W) na mesma resolução,
+# com as operações vetorizadas no lote inteiro e sem o mapa de diferenças
+def ssim_batch(upload, refs):
+    win = upload.win
+    cov_norm = np.float32(win * win / (win * win - 1))
+    c1 = np.float32((K1 * upload.data_range) ** 2)
+    c2 = np.float32((K2 * upload.data_range) ** 2)
+    y = np.asarray(refs, dtype=np.float32)
+    if y.ndim == 2:
+        y = y[None]
+    y = y - np.float32(OFFSET)
+
+    mu_y = _box_mean(y, win)
+    var_y = cov_norm * (_box_mean(y * y, win) - mu_y * mu_y)
+    cov = cov_norm * (_box_mean(upload.x * y, win) - upload.mu * mu_y)
+    mean_y = mu_y + np.float32(OFFSET)
+    numerator = (upload.luminance * mean_y + c1) * (2 * cov + c2)
+    denominator = (upload.luminance_den + mean_y * mean_y) * (upload.var_c2 + var_y)
+    return (numerator / denominator).mean(axis=(-2, -1), dtype=np.float64)
+
+
+# comparar com o skimage nos mesmos pares (diferença absoluta máxima e média)
+def agreement(pairs):
+    from skimage.metrics import structural_similarity
+    diffs = np.array([abs(float(ssim_batch(UploadStats(a), b)[0]) - structural_similarity(a, b))
+                      for a, b in pairs])
+    return {"pairs": len(diffs), "max_abs_diff": float(diffs.max()) if len(diffs) else 0.0,
+            "mean_abs_diff": float(diffs.mean()) if len(diffs) else 0.0}
@@ -0,0 +1,68 @@
+import threading
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+from reference_index import IMAGE_EXTENSIONS
+
+
+class _ReferenceEventHandler(FileSystemEventHandler):
+    def __init__(self, watcher, index):
+        self.watcher = watcher
+        self.index = index
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        if any(str(p).lower().endswith(IMAGE_EXTENSIONS) for p in paths if p):
+            self.watcher.schedule(self.index)
+
+
+# observa os diretórios de referência e aplica as mudanças em segundo plano;
+# rajadas de eventos (cópia de vários arquivos) viram uma única atualização
+class ReferenceWatcher:
+    def __init__(self, debounce=1.0):
+        self.debounce = debounce
+        self._observer = Observer()
+        self._observer.daemon = True
+        self._timers = {}
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        self.errors = 0
+        self._observer.start()
+
+    def watch(self, index):
+        self._observer.schedule(
+            _ReferenceEventHandler(self, index), index.reference_dir, recursive=False)
+        index.watched = True
+
+    def schedule(self, index):
+        with self._lock:
+            timer = self._timers.get(index.reference_dir)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(self.debounce, self._refresh, [index])
+            timer.daemon = True
+            self._timers[index.reference_dir] = timer
+            timer.start()
+
+    def _refresh(self, index):
+        with self._lock:
+            self._timers.pop(index.reference_dir, None)
+        try:
+            if index.refresh():
+                self.refreshes += 1
+                print(f"Referências atualizadas em {index.reference_dir}: "
+                      f"{len(index.snapshot)} imagens (versão {index.snapshot.version})")
+        except Exception as e:
+            self.errors += 1
+            print(f"Falha ao atualizar {index.reference_dir}: {e}")
+
+    def stats(self):
+        return {"debounce": self.debounce, "refreshes": self.refreshes,
+                "errors": self.errors, "pending": len(self._timers)}
+
+    def stop(self):
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+        self._observer.stop()
@@ -0,0 +1,82 @@
+import os
+import asyncio
+import functools
+import contextvars
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class Reservation:
+    def __init__(self, pool):
+        self._pool = pool
+        self._lock = threading.Lock()
+        self.released = False
+
+    def release(self):
+        with self._lock:
+            if self.released:
+                return
+            self.released = True
+        self._pool.release()
+
+
+# pool limitado para as etapas que usam CPU (decodificação, SSIM, gráfico),
+# com controle de admissão: passado o limite, novas requisições são recusadas
+class BoundedExecutor:
+    def __init__(self, max_workers=None, max_pending=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="cpu")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+
+    # reservar uma vaga para a requisição inteira, ou falhar imediatamente
+    def acquire(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PoolSaturated()
+            self.pending += 1
+
+    def release(self):
+        with self._lock:
+            self.pending -= 1
+
+    # vaga que sobrevive ao handler (streaming): liberada uma única vez, por quem
+    # chegar primeiro
+    def reserve(self):
+        self.acquire()
+        return Reservation(self)
+
+    @contextmanager
+    def admit(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    # o contexto da requisição acompanha a função até a thread (métricas por requisição)
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(context.run, fn, *args, **kwargs))
+
+    def stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)